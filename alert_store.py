@@ -0,0 +1,93 @@
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from constants import ALERTS_FOLDER, ALERTS_INDEX_PATH
+from tracing import tracer
+
+
+class AlertStore:
+    """ Алерты по id за O(1).
+    В памяти держим dict id -> alert, на диске - индекс id -> (файл фида, offset, length).
+    Файл фида пишется как json-массив, по одному алерту на строку, поэтому любой алерт
+    можно прочитать seek'ом, не парся весь файл. """
+
+    def __init__(self, folder: Path = ALERTS_FOLDER, index_path: Path = ALERTS_INDEX_PATH):
+        self.folder = folder
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        self._alerts: Dict[str, dict] = {}
+        try:
+            self._index: Dict[str, list] = json.loads(self.index_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._index = {}
+
+    def write_feed(self, feed_path: Path, alerts: List[dict]) -> None:
+        chunks = []
+        positions = {}
+        offset = len(b"[\n")
+        with tracer.span("alerts.write_feed", feed_path.name):
+            for i, alert in enumerate(alerts):
+                line = json.dumps(alert).encode()
+                positions[alert["id"]] = [feed_path.name, offset, len(line)]
+                offset += len(line) + len(b",\n" if i < len(alerts) - 1 else b"\n")
+                chunks.append(line)
+            feed_path.write_bytes(b"[\n" + b",\n".join(chunks) + b"\n]" if chunks else b"[]")
+
+        with self._lock:
+            # выпавшие из фида алерты убираем и из памяти: в daemon.py процесс живет сутками
+            stale = [
+                alert_id for alert_id, pos in self._index.items()
+                if pos[0] == feed_path.name and alert_id not in positions
+            ]
+            for alert_id in stale:
+                del self._index[alert_id]
+                self._alerts.pop(alert_id, None)
+            self._index.update(positions)
+            self._alerts.update({alert["id"]: alert for alert in alerts})
+
+    def load_feed(self, feed_path: Path) -> List[dict]:
+        """ фид с прошлого запуска (304): поднимаем в память, при необходимости переиндексируем """
+        with tracer.span("alerts.load_feed", feed_path.name):
+            alerts = json.loads(feed_path.read_text())
+        with self._lock:
+            indexed = all(self._index.get(alert["id"], [None])[0] == feed_path.name for alert in alerts)
+        if indexed:
+            with self._lock:
+                self._alerts.update({alert["id"]: alert for alert in alerts})
+        else:
+            self.write_feed(feed_path, alerts)
+        return alerts
+
+    def get(self, alert_id: str) -> dict:
+        with self._lock:
+            alert = self._alerts.get(alert_id)
+            pos = self._index.get(alert_id)
+        if alert is not None:
+            return alert
+        if pos is None:
+            raise KeyError(alert_id)
+
+        file_name, offset, length = pos
+        with open(self.folder / file_name, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def __contains__(self, alert_id: str) -> bool:
+        with self._lock:
+            return alert_id in self._alerts or alert_id in self._index
+
+    def __iter__(self) -> Iterator[dict]:
+        """ алерты, загруженные в этом запуске """
+        with self._lock:
+            alerts = list(self._alerts.values())
+        return iter(alerts)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._alerts)
+
+    def save_index(self) -> None:
+        with self._lock:
+            self.index_path.write_text(json.dumps(self._index))
@@ -1,11 +1,10 @@
 import streamlit as st
 import plotly.graph_objects as go
 from streamlit_autorefresh import st_autorefresh
-import json
-from pathlib import Path
 from datetime import datetime
 import time
-from checkpoint import CheckpointManager, STAGES
+from checkpoint import STAGES
+from dashboard_data import DashboardData
 import subprocess
 import pandas as pd
 
@@ -37,6 +36,13 @@ st.markdown("""
 # Auto-refresh every 3 seconds
 st_autorefresh(interval=3000)
 
+@st.cache_resource
+def get_dashboard_data() -> DashboardData:
+    # один кэш на процесс streamlit, общий для всех сессий/вкладок
+    return DashboardData()
+
+# фигуры для одинаковых значений не пересобираем (пока ничего не идет, значения не меняются)
+@st.cache_resource(max_entries=64)
 def create_gauge(value, title, max_value=100):
     return go.Figure(go.Indicator(
         mode="gauge+number",
@@ -82,6 +88,18 @@ with col1:
             st.session_state.process = subprocess.Popen(["python", "main.py"])
             st.session_state.process_running = True
             st.session_state.start_time = time.time()
+        # фиды опрашиваются по своему расписанию, пока процесс не остановят кнопкой Stop (SIGTERM)
+        if st.button("🛰️ Start Daemon", use_container_width=True):
+            st.session_state.process = subprocess.Popen(["python", "daemon.py"])
+            st.session_state.process_running = True
+            st.session_state.start_time = time.time()
+with col3:
+    if not st.session_state.process_running:
+        last_run_id = get_dashboard_data().latest_run_id()
+        if last_run_id and st.button(f"⏯️ Resume run {last_run_id}", use_container_width=True):
+            st.session_state.process = subprocess.Popen(["python", "main.py", "--resume", last_run_id])
+            st.session_state.process_running = True
+            st.session_state.start_time = time.time()
 with col2:
     if st.session_state.process_running:
         if st.button("⏹️ Stop Processing", use_container_width=True):
@@ -89,9 +107,8 @@ with col2:
                 st.session_state.process.terminate()
             st.session_state.process_running = False
 
-# Initialize checkpoint manager
-checkpoint_mgr = CheckpointManager()
-stats = checkpoint_mgr.load_latest_checkpoint()
+dashboard_data = get_dashboard_data()
+stats = dashboard_data.checkpoint()
 
 if stats:
     # Progress Section
@@ -159,40 +176,82 @@ if stats:
     
     with col1:
         fig = create_gauge(
-            stats.get('filtered_count', 0) / max(stats.get('total_alerts', 1), 1) * 100,
+            round(stats.get('filtered_count', 0) / max(stats.get('total_alerts', 1), 1) * 100, 1),
             "Filter Rate (%)"
         )
         st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         fig = create_gauge(
-            min(stats.get('tokens_processed', 0) / 1000, 100),
+            round(min(stats.get('tokens_processed', 0) / 1000, 100), 1),
             "Tokens Processed (K)",
             max_value=100
         )
         st.plotly_chart(fig, use_container_width=True)
 
+    # Where the time goes: стадии, перцентили по операциям, самые медленные элементы
+    if stats.get('stage_times') or stats.get('spans'):
+        st.markdown("### ⏱️ Time Breakdown")
+        col1, col2 = st.columns(2)
+        with col1:
+            stage_times = stats.get('stage_times', {})
+            if stage_times:
+                fig = go.Figure(go.Bar(
+                    x=list(stage_times.values()),
+                    y=list(stage_times.keys()),
+                    orientation='h',
+                    marker_color="#2196F3",
+                ))
+                fig.update_layout(title="Time per stage (s)", yaxis={'autorange': 'reversed'}, height=300)
+                st.plotly_chart(fig, use_container_width=True)
+        with col2:
+            slowest = stats.get('slowest', [])
+            if slowest:
+                st.caption("Slowest items")
+                st.dataframe(pd.DataFrame(slowest), hide_index=True, use_container_width=True)
+        spans = stats.get('spans', {})
+        if spans:
+            st.caption("Latency per operation (s)")
+            st.dataframe(
+                pd.DataFrame.from_dict(spans, orient='index')[['count', 'p50', 'p95', 'p99', 'max', 'total']],
+                use_container_width=True
+            )
+
+    # Токены по стадиям: точные суммы по элементам, распределение и оценка стоимости входа
+    token_stages = stats.get('token_stages', {})
+    if token_stages:
+        total_cost = sum(stage['cost_usd'] for stage in token_stages.values())
+        st.markdown(f"### 🔤 Tokens per stage (~${total_cost:.4f})")
+        st.dataframe(pd.DataFrame.from_dict(token_stages, orient='index'), use_container_width=True)
+
+    # Распределенный запуск (main.py --distributed): задания очереди и счетчики каждого воркера
+    workers = stats.get('workers', {})
+    if workers:
+        st.markdown(f"### 🧩 Workers ({workers['alive']} alive)")
+        st.caption(", ".join(f"{state}: {count}" for state, count in workers['jobs'].items()))
+        st.dataframe(
+            pd.DataFrame.from_dict(workers['workers'], orient='index').fillna(0),
+            use_container_width=True
+        )
+
     # Show final results if available
-    final_folder = Path("final")
-    if final_folder.exists():
-        latest_final = max(final_folder.glob("*.json"), key=lambda x: x.stat().st_mtime, default=None)
-        if latest_final:
-            st.markdown("### 🎉 Latest Results")
-            try:
-                results = json.loads(latest_final.read_text())
-                df = pd.DataFrame(results)
-                st.dataframe(
-                    df[['title', 'published', 'summary', 'link']],
-                    column_config={
-                        "link": st.column_config.LinkColumn("Link"),
-                        "title": "Title",
-                        "published": "Published",
-                        "summary": "Summary"
-                    },
-                    hide_index=True,
-                    use_container_width=True
-                )
-            except Exception as e:
-                st.error(f"Error loading results: {e}")
+    try:
+        df = dashboard_data.final()
+    except Exception as e:
+        df = None
+        st.error(f"Error loading results: {e}")
+    if df is not None:
+        st.markdown("### 🎉 Latest Results")
+        st.dataframe(
+            df,
+            column_config={
+                "link": st.column_config.LinkColumn("Link"),
+                "title": "Title",
+                "published": "Published",
+                "summary": "Summary"
+            },
+            hide_index=True,
+            use_container_width=True
+        )
 else:
     st.info("👆 Click 'Start Processing' to begin news analysis")
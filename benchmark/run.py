@@ -0,0 +1,150 @@
+""" Офлайн-бенчмарк пайплайна: python -m benchmark.run --alerts 100 1000 10000
+
+Поднимает локальные подмены (синтетические фиды и статьи, фейковый Gemini),
+на каждый масштаб гоняет main.main() в отдельном процессе с чистой рабочей папкой
+и печатает время по стадиям, req/s, токены и пиковый RSS. Сеть не нужна
+(кроме кодировки tiktoken - она должна лежать в кэше, см. TIKTOKEN_CACHE_DIR). """
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmark.servers import SyntheticWeb, FakeGemini
+from benchmark.worker import RESULT_FILE
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_scale(alerts: int, args, web: SyntheticWeb, gemini: FakeGemini, host_limits: bool = False) -> dict:
+    feeds = math.ceil(alerts / args.entries_per_feed)
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_{alerts}_"))
+    config = {
+        "feeds": feeds,
+        "web_url": web.url,
+        "gemini_url": gemini.url,
+        "stream": args.stream,
+        "host_limits": host_limits,
+    }
+    env = {
+        **os.environ,
+        "BENCH_CONFIG": json.dumps(config),
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])),
+    }
+    web_before, gemini_before = web.snapshot(), gemini.snapshot()
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmark.worker"],
+        cwd=workdir, env=env, capture_output=not args.verbose, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    web_requests, gemini_requests = web.snapshot() - web_before, gemini.snapshot() - gemini_before
+
+    try:
+        if process.returncode != 0:
+            raise RuntimeError(f"worker failed ({process.returncode}):\n{(process.stdout or '')[-3000:]}"
+                               f"{(process.stderr or '')[-3000:]}")
+        result = json.loads((workdir / RESULT_FILE).read_text())
+    finally:
+        if args.keep:
+            print(f"Workdir kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    wall = result["wall"]
+    stages = result["stages"]
+    rss_stage = stages.get("Fetching RSS Feeds", 0.0)
+    return {
+        "alerts": result["stats"]["total_alerts"],
+        "host_limits": host_limits,
+        "feeds": feeds,
+        "wall": round(wall, 3),
+        "process": round(elapsed, 3),
+        "stages": stages,
+        "spans": result["spans"],
+        "feed_requests": web_requests["feed"],
+        "page_requests": web_requests["page"],
+        "llm_requests": gemini_requests["generateContent"],
+        "feeds_per_sec": round(web_requests["feed"] / rss_stage, 1) if rss_stage else None,
+        "requests_per_sec": round(
+            (web_requests["feed"] + web_requests["page"] + gemini_requests["generateContent"]) / wall, 1
+        ),
+        "alerts_per_sec": round(result["stats"]["total_alerts"] / wall, 1),
+        "tokens_processed": result["stats"]["tokens_processed"],
+        "llm_prompt_tokens": gemini_requests["prompt_tokens"],
+        "llm_cached_tokens": gemini_requests["cached_tokens"],
+        "context_caches": gemini_requests["cachedContents"],
+        "llm_output_tokens": gemini_requests["output_tokens"],
+        "prefiltered": result["stats"]["prefiltered_count"],
+        "results": result["results"],
+        "errors": result["stats"]["error_count"],
+        "peak_rss_mb": result["peak_rss_mb"],
+        "peak_rss_children_mb": result["peak_rss_children_mb"],
+    }
+
+
+def print_report(rows: list) -> None:
+    for row in rows:
+        limits = ", host limits" if row["host_limits"] else ""
+        print(f"\n=== {row['alerts']} alerts ({row['feeds']} feeds{limits}): {row['wall']:.2f}s, "
+              f"{row['alerts_per_sec']} alerts/s")
+        for stage, seconds in row["stages"].items():
+            print(f"  {stage:<40} {seconds:8.3f}s")
+        for operation, span in row["spans"].items():
+            print(f"  {operation:<24} n={span['count']:<6} p50 {span['p50']:.4f}s  p95 {span['p95']:.4f}s  "
+                  f"p99 {span['p99']:.4f}s  total {span['total']:.2f}s")
+        print(f"  requests: {row['feed_requests']} feeds, {row['page_requests']} pages, {row['llm_requests']} LLM"
+              f" -> {row['requests_per_sec']} req/s (feeds {row['feeds_per_sec']}/s)")
+        print(f"  tokens: {row['tokens_processed']} counted, {row['llm_prompt_tokens']} prompt "
+              f"({row['llm_cached_tokens']} from {row['context_caches']} context caches) / "
+              f"{row['llm_output_tokens']} output at LLM")
+        print(f"  alerts: {row['prefiltered']} prefiltered, {row['results']} results, {row['errors']} errors")
+        print(f"  peak RSS: {row['peak_rss_mb']} MB (largest child process {row['peak_rss_children_mb']} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, nargs="+", default=[100, 1000], help="масштабы (число алертов)")
+    parser.add_argument("--entries-per-feed", type=int, default=20, help="как у Google Alerts")
+    parser.add_argument("--page-bytes", type=int, default=20_000)
+    parser.add_argument("--web-latency", type=float, default=0.05, help="задержка ответа фидов и страниц (сек)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="задержка ответа LLM (сек)")
+    parser.add_argument("--relevant-rate", type=float, default=0.3, help="доля алертов с ключевыми словами")
+    parser.add_argument("--dup-rate", type=float, default=0.05, help="доля почти-дубликатов")
+    parser.add_argument("--stream", action="store_true", help="гонять main.py в режиме --stream")
+    parser.add_argument("--host-limits", action="store_true", help="не снимать per-host ограничения")
+    parser.add_argument("--polite-alerts", type=int, default=100,
+                        help="дополнительно прогнать этот масштаб с per-host ограничениями, как в проде (0 - не гонять)")
+    parser.add_argument("--output", type=Path, help="записать результаты в json (для сравнения в CI)")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочие папки")
+    parser.add_argument("--verbose", action="store_true", help="показывать вывод main.py")
+    args = parser.parse_args()
+
+    web = SyntheticWeb(
+        entries_per_feed=args.entries_per_feed,
+        page_bytes=args.page_bytes,
+        latency=args.web_latency,
+        relevant_rate=args.relevant_rate,
+        dup_rate=args.dup_rate,
+    )
+    with web, FakeGemini(latency=args.llm_latency) as gemini:
+        rows = []
+        for alerts in args.alerts:
+            print(f"Running {alerts} alerts...", flush=True)
+            rows.append(run_scale(alerts, args, web, gemini, args.host_limits))
+        # без per-host лимитов не видно, если все страницы вдруг оказались на одном хосте
+        if args.polite_alerts and not args.host_limits:
+            print(f"Running {args.polite_alerts} alerts with host limits...", flush=True)
+            rows.append(run_scale(args.polite_alerts, args, web, gemini, host_limits=True))
+    print_report(rows)
+    if args.output:
+        args.output.write_text(json.dumps(rows, indent=4, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# Локальные подмены внешних сервисов для бенчмарка: синтетические RSS-фиды + страницы и фейковый Gemini
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from html import escape
+from urllib.parse import quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from prefilter import parse_keyword_groups
+
+FILLER = (
+    "market report city council weather season team player museum travel recipe festival school traffic "
+    "garden concert bridge river harbor library theater village farmer bakery railway mountain island "
+    "coffee winter summer election street holiday planet ocean forest painting novel stadium"
+).split()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # сотни одновременных соединений от пулов пайплайна
+    request_queue_size = 1024
+
+
+class _Background:
+    """ HTTP-сервер в фоновом потоке на свободном порту 127.0.0.1 """
+
+    handler = BaseHTTPRequestHandler
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        owner = self
+
+        class Handler(self.handler):
+            server_owner = owner
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = _Server(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def count(self, kind: str, **extra: int) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+            self.requests.update(extra)
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.requests)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _WebHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        web = self.server_owner
+        if web.latency:
+            time.sleep(web.latency)
+        feed_match = re.fullmatch(r"/feeds/(\d+)\.xml", self.path)
+        page_match = re.fullmatch(r"/pages/(\d+)/(\d+)\.html", self.path)
+        if feed_match:
+            web.count("feed")
+            body, content_type = web.feed(int(feed_match.group(1))), "application/atom+xml"
+        elif page_match:
+            web.count("page")
+            body, content_type = web.page(int(page_match.group(1)), int(page_match.group(2))), "text/html; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class SyntheticWeb(_Background):
+    """ Фиды в формате Google Alerts (Atom) и статьи к ним.
+
+    /feeds/<feed>.xml - entries_per_feed записей, /pages/<feed>/<entry>.html - статья ~page_bytes.
+    relevant_rate записей содержат ключевые слова из WHAT_IS_IMPORTANT (проходят префильтр),
+    dup_rate - почти-дубликаты соседней записи (склеиваются дедупликацией). Статьи раздаются sites
+    отдельными серверами, redirect_rate ссылок обернуты в www.google.com/url. Контент детерминирован (seed). """
+
+    handler = _WebHandler
+
+    def __init__(self, entries_per_feed: int = 20, page_bytes: int = 20_000, latency: float = 0.0,
+                 relevant_rate: float = 0.3, dup_rate: float = 0.05, seed: int = 0,
+                 sites: int = 8, redirect_rate: float = 0.5):
+        super().__init__(latency)
+        # статьи лежат на sites отдельных "сайтах" (свой порт - свой хост для per-host лимитов)
+        self.sites = [_Server(("127.0.0.1", 0), self.httpd.RequestHandlerClass) for _ in range(sites)]
+        self.site_threads = [threading.Thread(target=site.serve_forever, daemon=True) for site in self.sites]
+        self.redirect_rate = redirect_rate
+        self.entries_per_feed = entries_per_feed
+        self.page_bytes = page_bytes
+        self.relevant_rate = relevant_rate
+        self.dup_rate = dup_rate
+        self.seed = seed
+        self.keywords = sorted({kw for kws in parse_keyword_groups().values() for kw in kws})
+
+    def __enter__(self):
+        for thread in self.site_threads:
+            thread.start()
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        for site in self.sites:
+            site.shutdown()
+            site.server_close()
+        super().__exit__(*exc)
+
+    def page_link(self, feed: int, entry: int) -> str:
+        """ ссылка записи; доля redirect_rate - как в настоящих Google Alerts, через www.google.com/url:
+        пайплайн, который ее не разворачивает, пойдет в сеть и страницу не получит """
+        site = self.sites[(feed * self.entries_per_feed + entry) % len(self.sites)] if self.sites else self.httpd
+        link = f"http://127.0.0.1:{site.server_port}/pages/{feed}/{entry}.html"
+        if self._rng(feed, entry, 2).random() < self.redirect_rate:
+            link = f"https://www.google.com/url?rct=j&sa=t&url={quote(link, safe='')}&ct=ga&cd=CAIY&usg=bench"
+        return link
+
+    def _rng(self, *key: int) -> random.Random:
+        return random.Random(":".join(map(str, (self.seed, *key))))
+
+    def _story(self, feed: int, entry: int) -> List[str]:
+        rng = self._rng(feed, entry)
+        if entry > 0 and rng.random() < self.dup_rate:
+            # та же новость, что и у предыдущей записи, с небольшой правкой
+            words = self._story(feed, entry - 1)
+            return words[:-1] + [rng.choice(FILLER)]
+        words = rng.choices(FILLER, k=24)
+        if rng.random() < self.relevant_rate:
+            for keyword in rng.sample(self.keywords, 3):
+                words.insert(rng.randrange(len(words)), keyword)
+        return words + [f"n{feed}x{entry}"]
+
+    def feed(self, feed: int) -> str:
+        entries = []
+        for entry in range(self.entries_per_feed):
+            words = self._story(feed, entry)
+            title = " ".join(words[:8]).capitalize() + f" #{feed}-{entry}"
+            snippet = " ".join(words)
+            published = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1_700_000_000 + feed * 1000 + entry))
+            entries.append(
+                f"<entry><id>tag:bench,{feed}:{entry}</id><title>{escape(title)}</title>"
+                f'<link href="{escape(self.page_link(feed, entry))}"/>'
+                f"<published>{published}</published><updated>{published}</updated>"
+                f'<content type="html">{escape(snippet)}</content></entry>'
+            )
+        return (
+            '<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom">'
+            f"<title>bench feed {feed}</title>{''.join(entries)}</feed>"
+        )
+
+    def page(self, feed: int, entry: int) -> str:
+        rng = self._rng(feed, entry, 1)
+        story = " ".join(self._story(feed, entry))
+        paragraphs = [f"<p>{story}.</p>"]
+        size = len(paragraphs[0])
+        while size < self.page_bytes:
+            paragraph = "<p>" + " ".join(rng.choices(FILLER, k=60)).capitalize() + ".</p>"
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        nav = "".join(f'<li><a href="/x/{i}">{w}</a></li>' for i, w in enumerate(FILLER[:15]))
+        return (
+            f"<!DOCTYPE html><html><head><title>{story[:60]}</title></head><body>"
+            f"<nav><ul>{nav}</ul></nav><article><h1>{story[:60]}</h1>{''.join(paragraphs)}</article>"
+            "<footer>Copyright bench</footer></body></html>"
+        )
+
+
+class _GeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _body(self) -> dict:
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+    def _send_json(self, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        gemini = self.server_owner
+        if re.search(r"/cachedContents$", self.path):
+            request = self._body()
+            self._send_json(gemini.create_cache(request))
+            return
+        if not re.search(r"/models/[^/:]+:generateContent", self.path):
+            self.send_error(404)
+            return
+        request = self._body()
+        contents = "".join(
+            part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", [])
+        )
+        system = "".join(part.get("text", "") for part in request.get("systemInstruction", {}).get("parts", []))
+        cached_tokens = 0
+        if "cachedContent" in request:
+            system = gemini.cached_prompt(request["cachedContent"])
+            if system is None:
+                self.send_error(403, "CachedContent not found")
+                return
+            cached_tokens = len(system) // 4
+        if gemini.latency:
+            time.sleep(gemini.latency)
+        json_mode = request.get("generationConfig", {}).get("responseMimeType") == "application/json"
+        text = gemini.answer(contents, json_mode)
+        prompt_tokens = (len(contents) + len(system)) // 4
+        gemini.count(
+            "generateContent", prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, output_tokens=len(text) // 4
+        )
+
+        self._send_json({
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached_tokens,
+                "candidatesTokenCount": len(text) // 4,
+                "totalTokenCount": prompt_tokens + len(text) // 4,
+            },
+        })
+
+    def do_PATCH(self):
+        match = re.search(r"/(cachedContents/[^/?]+)", self.path)
+        cached = self.server_owner.refresh_cache(match.group(1), self._body()) if match else None
+        if cached is None:
+            self.send_error(404)
+            return
+        self._send_json(cached)
+
+
+class FakeGemini(_Background):
+    """ Отвечает на POST .../models/<model>:generateContent как Gemini API, готовым json,
+    и держит кэши контекста (POST/PATCH .../cachedContents) - system prompt по имени кэша.
+
+    Первый фильтр (json-список алертов) - каждый pick_every-й id в relevant_ids, следующий за ним в unsure_ids;
+    второй фильтр (текст страницы) - title + summary, для каждой reject_every-й страницы пустой ответ;
+    второй фильтр батчем (JSON-режим, список {id, text}) - то же самое по каждой статье. """
+
+    handler = _GeminiHandler
+
+    def __init__(self, latency: float = 0.0, pick_every: int = 3, reject_every: int = 4):
+        super().__init__(latency)
+        self.pick_every = pick_every
+        self.reject_every = reject_every
+        self.caches = {}  # имя кэша -> system prompt
+
+    def _cache_entry(self, name: str, ttl: str) -> dict:
+        expire = time.time() + float(ttl.rstrip("s"))
+        return {
+            "name": name,
+            "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(expire)),
+            "usageMetadata": {"totalTokenCount": len(self.caches[name]) // 4},
+        }
+
+    def create_cache(self, request: dict) -> dict:
+        system = "".join(part.get("text", "") for part in request.get("systemInstruction", {}).get("parts", []))
+        with self._lock:
+            name = f"cachedContents/bench{len(self.caches)}"
+            self.caches[name] = system
+        self.count("cachedContents")
+        return {**self._cache_entry(name, request.get("ttl", "3600s")), "model": request.get("model")}
+
+    def refresh_cache(self, name: str, request: dict) -> Optional[dict]:
+        if name not in self.caches:
+            return None
+        return self._cache_entry(name, request.get("ttl", "3600s"))
+
+    def cached_prompt(self, name: str) -> Optional[str]:
+        with self._lock:
+            return self.caches.get(name)
+
+    def summarize(self, text: str) -> Optional[dict]:
+        if zlib.crc32(text.encode()) % self.reject_every == 0:
+            return None
+        words = text.split()
+        return {"title": " ".join(words[:8]), "summary": " ".join(words[:40])}
+
+    def answer(self, contents: str, json_mode: bool = False) -> str:
+        try:
+            items = json.loads(contents)
+            ids = [item["id"] for item in items]
+        except (json.JSONDecodeError, TypeError, KeyError):
+            ids: Optional[list] = None
+        if ids is not None and json_mode:
+            entries = []
+            for item in items:
+                summary = self.summarize(item["text"])
+                entries.append({"id": item["id"], "relevant": summary is not None, **(summary or {})})
+            return json.dumps(entries, ensure_ascii=False)
+        if ids is not None:
+            response = {"relevant_ids": ids[::self.pick_every], "unsure_ids": ids[1::self.pick_every * 2]}
+            return "```json\n" + json.dumps(response) + "\n```"
+        return json.dumps(self.summarize(contents) or [], ensure_ascii=False)
@@ -0,0 +1,64 @@
+# Один прогон main.main() против локальных подмен; запускается run.py в отдельном процессе
+# с cwd = чистая временная папка (main.py пишет все относительно cwd и открывает хранилища при импорте)
+import json
+import os
+import resource
+import sys
+import time
+
+import constants
+
+RESULT_FILE = "bench_result.json"
+
+
+def configure(config: dict) -> None:
+    """ до импорта main: модули берут константы через from constants import ... """
+    constants.RSS_LINKS.clear()
+    constants.RSS_LINKS.update({f"bench_{i}": f"{config['web_url']}/feeds/{i}.xml" for i in range(config["feeds"])})
+    constants.API_KEY = "bench"
+    constants.GEMINI_BASE_URL = config["gemini_url"]
+    # меряем пайплайн, а не квоту прокси
+    constants.LLM_REQUESTS_PER_MINUTE = 1_000_000
+    constants.LLM_BURST = 1_000_000
+    # фейковый Gemini кэширует промпт любой длины - иначе наши промпты не дотягивают до минимума
+    constants.CONTEXT_CACHE_MIN_TOKENS = 0
+    if not config["host_limits"]:
+        # все "сайты" живут на одном 127.0.0.1:port - per-host вежливость превратила бы бенчмарк в sleep
+        constants.RSS_PER_HOST_CONCURRENCY = constants.RSS_MAX_WORKERS
+        constants.RSS_PER_HOST_DELAY = 0.0
+        constants.FETCH_PER_HOST_CONCURRENCY = constants.FETCH_WORKERS
+        constants.FETCH_PER_HOST_DELAY = 0.0
+
+
+def run(config: dict) -> dict:
+    configure(config)
+    import main
+
+    started = time.perf_counter()
+    main.main(stream=config["stream"])
+    finished = time.perf_counter()
+    main.checkpoint_mgr.save_checkpoint()
+    stats = main.checkpoint_mgr.get_current_stats()
+
+    # ru_maxrss в Linux - КБ
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return {
+        "wall": finished - started,
+        "stages": stats.pop("stage_times"),
+        "spans": stats.pop("spans"),
+        "slowest": stats.pop("slowest"),
+        "stats": stats,
+        "peak_rss_mb": round(self_rss, 1),
+        "peak_rss_children_mb": round(children_rss, 1),
+        "results": len(main.results.final(main.results.latest_run_id())),
+    }
+
+
+if __name__ == "__main__":
+    result = run(json.loads(os.environ["BENCH_CONFIG"]))
+    with open(RESULT_FILE, "w") as f:
+        json.dump(result, f)
+    sys.stdout.flush()
+    # не ждем пулы extraction/браузеров - они нужны были только внутри main()
+    os._exit(0)
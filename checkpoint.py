@@ -1,9 +1,15 @@
+import atexit
 import json
+import os
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, asdict, field
 from datetime import datetime
 
+from constants import CHECKPOINT_FLUSH_INTERVAL
+
 @dataclass
 class ProcessStats:
     total_alerts: int = 0
@@ -16,27 +22,125 @@ class ProcessStats:
     error_count: int = 0
     current_feed: str = ""
     stage_details: str = ""
+    prefiltered_count: int = 0
+    llm_cache_hits: int = 0
+    llm_cache_misses: int = 0
+    snippet_count: int = 0  # алерты, для которых вместо страницы хватило сниппета из фида
+    stage_times: Dict[str, float] = field(default_factory=dict)  # стадия -> секунды
+    spans: Dict[str, dict] = field(default_factory=dict)  # операция -> count/total/p50/p95/p99/max
+    slowest: List[dict] = field(default_factory=list)  # самые медленные элементы (операция, элемент, секунды)
+    workers: dict = field(default_factory=dict)  # rollup воркеров распределенного запуска (workqueue.py)
+    token_stages: Dict[str, dict] = field(default_factory=dict)  # стадия -> токены: сумма, распределение, стоимость
 
 class CheckpointManager:
-    def __init__(self, checkpoint_dir: str = ".checkpoints"):
+    """ Обновления статистики копятся в памяти и сбрасываются на диск фоновым потоком
+    не чаще, чем раз в flush_interval секунд; смена стадии сбрасывается сразу.
+    Запись атомарная (tmp + rename), так что дашборд никогда не видит недописанный json. """
+
+    def __init__(self, checkpoint_dir: str = ".checkpoints", flush_interval: float = CHECKPOINT_FLUSH_INTERVAL,
+                 tracer=None):
         self.checkpoint_dir = Path(checkpoint_dir)
         self.checkpoint_dir.mkdir(exist_ok=True)
         self.current_run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.stats = ProcessStats()
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        # tracing.Tracer: его гистограммы попадают в каждый сохраненный чекпоинт
+        self.tracer = tracer
+        self._stage_started = time.perf_counter()
+        self._stage_elapsed: Dict[str, float] = {}
         
+    def start_run(self) -> str:
+        """ новый запуск в том же процессе (daemon.py): свой run_id, чистая статистика """
+        self.flush()
+        with self._lock:
+            base_id = run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # два запуска в одну секунду не должны делить файл чекпоинта и журнал
+            suffix = 1
+            while (self.checkpoint_dir / f"checkpoint_{run_id}.json").exists() or run_id == self.current_run_id:
+                suffix += 1
+                run_id = f"{base_id}_{suffix}"
+            self.current_run_id = run_id
+            self.stats = ProcessStats()
+            self._stage_started = time.perf_counter()
+            self._stage_elapsed = {}
+            self._dirty = False
+        return self.current_run_id
+
     def _get_checkpoint_path(self) -> Path:
         return self.checkpoint_dir / f"checkpoint_{self.current_run_id}.json"
     
     def update_stats(self, **kwargs) -> None:
-        for key, value in kwargs.items():
-            if hasattr(self.stats, key):
-                setattr(self.stats, key, value)
-        self.stats.last_update = datetime.now().isoformat()
-        self.save_checkpoint()
+        with self._lock:
+            stage_changed = kwargs.get("current_stage", self.stats.current_stage) != self.stats.current_stage
+            if stage_changed:
+                self._close_stage()
+            for key, value in kwargs.items():
+                if hasattr(self.stats, key):
+                    setattr(self.stats, key, value)
+            self.stats.last_update = datetime.now().isoformat()
+            self._dirty = True
+        if stage_changed:
+            self.flush()
+        else:
+            self._ensure_flusher()
+    
+    def _close_stage(self) -> None:
+        """ время закончившейся стадии - в stage_times (и событием в трейс) """
+        now = time.perf_counter()
+        stage = self.stats.current_stage
+        if stage == ProcessStats.current_stage:
+            # до первого update_stats стадии еще нет
+            self._stage_started = now
+            return
+        self._stage_elapsed[stage] = self._stage_elapsed.get(stage, 0.0) + now - self._stage_started
+        if self.tracer is not None:
+            self.tracer.event(stage, self._stage_started, now - self._stage_started, category="stage")
+        self._stage_started = now
+
+    def _ensure_flusher(self) -> None:
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="checkpoint-flusher", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+    
+    def _flush_loop(self) -> None:
+        while not self._wakeup.wait(self.flush_interval):
+            self.flush()
+    
+    def flush(self) -> None:
+        """ записать, если с прошлой записи что-то поменялось """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            self.save_checkpoint()
+    
+    def close(self) -> None:
+        self._wakeup.set()
+        self.flush()
     
     def save_checkpoint(self) -> None:
-        checkpoint_data = asdict(self.stats)
-        self._get_checkpoint_path().write_text(json.dumps(checkpoint_data, indent=2))
+        with self._lock:
+            # текущая стадия - с учетом уже прошедшего времени
+            stage_times = dict(self._stage_elapsed)
+            current = self.stats.current_stage
+            if current != ProcessStats.current_stage:
+                stage_times[current] = stage_times.get(current, 0.0) + time.perf_counter() - self._stage_started
+            self.stats.stage_times = {stage: round(seconds, 3) for stage, seconds in stage_times.items()}
+            if self.tracer is not None:
+                self.stats.spans = self.tracer.summary()
+                self.stats.slowest = self.tracer.slowest()
+            checkpoint_data = json.dumps(asdict(self.stats), indent=2)
+            path = self._get_checkpoint_path()
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(checkpoint_data)
+            os.replace(tmp_path, path)
     
     def load_latest_checkpoint(self) -> Optional[Dict[str, Any]]:
         try:
@@ -56,5 +160,6 @@ STAGES = {
     "FIRST_FILTER": "First-pass Content Filtering",
     "CONTENT_FETCH": "Fetching Full Content",
     "SECOND_FILTER": "Second-pass Content Analysis",
-    "FINAL": "Finalizing Results"
+    "FINAL": "Finalizing Results",
+    "STREAMING": "Streaming Filter, Fetch and Analysis"
 }
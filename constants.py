@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 
@@ -6,16 +7,100 @@ RSS_LINKS = {
 }
 
 API_KEY = ""
+GEMINI_BASE_URL = "https://api.proxyapi.ru/google"
+GEMINI_MODEL = "gemini-2.5-flash"
+
+LLM_MAX_IN_FLIGHT = 8  # одновременных запросов к LLM
+LLM_REQUESTS_PER_MINUTE = 60  # квота прокси
+LLM_BURST = 8  # сколько запросов можно отправить разом, не дожидаясь пополнения квоты
+LLM_MAX_RETRIES = 4  # повторы на 429/5xx
+LLM_BACKOFF_BASE = 1.0  # сек, backoff = random(0, base * 2^attempt)
+LLM_BACKOFF_MAX = 30.0
+
+LLM_CACHE_FOLDER = Path(".llm_cache")
+LLM_CACHE_TTL = 24 * 60 * 60  # сек
+LLM_CACHE_MAX_BYTES = 200 * 1024 * 1024
+LLM_PRICE_INPUT_PER_MILLION = 0.30  # $ за 1M входных токенов GEMINI_MODEL, для оценки стоимости стадий
+LLM_PRICE_CACHED_INPUT_PER_MILLION = 0.075  # то же для токенов из кэша контекста (хранение кэша не считаем)
+CONTEXT_CACHE = True  # system prompt один раз в кэш контекста Gemini (caches.create), запросы ссылаются на него
+CONTEXT_CACHE_PATH = Path(".context_caches.json")  # (модель, хэш промпта) -> имя кэша и срок, между запусками
+CONTEXT_CACHE_TTL = 6 * 60 * 60  # сек, на сколько создается/продлевается кэш
+CONTEXT_CACHE_REFRESH_MARGIN = 10 * 60  # сек, кэш, которому осталось меньше, продлеваем до запросов
+CONTEXT_CACHE_MIN_TOKENS = 1024  # меньше Gemini кэшировать не дает (минимум для GEMINI_MODEL)
+CONTEXT_CACHE_RETRY_AFTER = 24 * 60 * 60  # сек, через сколько снова пробовать, если бэкенд кэш не создал
+TOKEN_CACHE_PATH = Path(".token_counts.json")  # хэш текста -> число токенов, между запусками
+TOKEN_CACHE_MAX_ENTRIES = 200_000
+TOKEN_ENCODE_THREADS = 8  # потоки tiktoken encode_batch
 
 ALERTS_FOLDER = Path("alerts")
 CONTENTS_FOLDER = Path("contents")
 RESPONSES_1_FOLDER = Path("responses_1")
 RESPONSES_2_FOLDER = Path("responses_2")
 FINAL_FOLDER = Path("final")
+FEED_STATE_PATH = Path(".feed_state.json")  # ETag/Last-Modified по каждому фиду
+ALERTS_INDEX_PATH = Path(".alerts_index.json")  # id алерта -> (файл фида, offset, length)
+LEDGER_PATH = Path(".ledger.json")  # вердикты по алертам между запусками
+JOURNAL_FOLDER = Path(".journal")  # append-only журналы запусков для --resume
+RESULTS_DB_PATH = Path("results.db")  # SQLite (WAL): алерты, страницы, вердикты и итоги всех запусков
+EXPORT_JSON = True  # дополнительно выгружать результаты запуска в json-папки выше (старый формат)
+CHECKPOINT_FLUSH_INTERVAL = 0.5  # сек, не чаще этого чекпоинт пишется на диск (смена стадии - сразу)
+TRACE_FOLDER = Path(".traces")  # chrome-trace json запусков с --trace
+TRACE_MAX_EVENTS = 200_000  # больше событий в трейс не пишем (гистограммы считаются всегда)
+TRACE_SLOWEST = 10  # сколько самых медленных элементов держать на операцию
+
+FEED_SCHEDULE_PATH = Path(".feed_schedule.json")  # интервалы опроса фидов в режиме daemon.py
+DAEMON_DEFAULT_INTERVAL = 30 * 60  # сек, стартовый интервал опроса фида
+DAEMON_MIN_INTERVAL = 5 * 60
+DAEMON_MAX_INTERVAL = 6 * 60 * 60
+DAEMON_TARGET_NEW_PER_POLL = 3  # интервал подбирается так, чтобы за опрос приходило ~столько новых записей
+DAEMON_RATE_SMOOTHING = 0.3  # вес последнего опроса в скользящей оценке частоты новых записей
+DAEMON_BATCH_WINDOW = 60  # фиды, которым пора опрашиваться в ближайшие N сек, берем одной пачкой
+
+RSS_MAX_WORKERS = 16
+# Все фиды Google Alerts живут на одном www.google.com, так что на практике это лимит всего стадии 1:
+# пауза 0.5 с дала бы >= 150 с на 300 фидов. Поэтому вежливость - только параллелизм (8 conditional GET,
+# в основном 304, это ~10-20 с на 300 фидов); если хост начнет отвечать 429, поднять паузу ценой времени
+RSS_PER_HOST_CONCURRENCY = 8  # сколько фидов с одного хоста качаем одновременно
+RSS_PER_HOST_DELAY = 0.0  # пауза между запросами к одному хосту (сек)
+
+FETCH_BACKEND = "http"  # "http" (браузер только как fallback) или "browser"
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 15  # сек на одну страницу
+FETCH_PER_HOST_CONCURRENCY = 2  # не больше N страниц одного домена одновременно
+FETCH_PER_HOST_DELAY = 1.0  # пауза между запросами к одному домену (сек)
+BROWSER = "chrome"  # chrome / firefox / safari
+BROWSER_POOL_SIZE = 2  # долгоживущие headless-драйверы, общие для всех воркеров
+EXTRACT_WORKERS = os.cpu_count() or 2  # процессы для trafilatura/justext/bs4
+EXTRACT_TIMEOUT = 30  # сек на чистку одной страницы
+MAX_HTML_CHARS = 2_000_000  # html длиннее обрезается перед чисткой
+FETCH_MAX_BYTES = 2_000_000  # тело ответа читается потоком и обрывается на этом размере
+FETCH_HTML_TYPES = ("text/html", "application/xhtml+xml")  # остальное (pdf, видео, картинки) не качаем
+PAGE_TEXT_TOKENS = 250  # столько токенов текста страницы уходит во второй фильтр
+EXTRACT_STEP_CHARS = 200_000  # чистим сначала начало html; текста меньше PAGE_TEXT_TOKENS - берем вчетверо больше
+JS_SHELL_MIN_TEXT = 200  # меньше символов текста + признаки SPA -> страница рендерится JS, идем в браузер
+STREAM_QUEUE_SIZE = 32  # емкость очередей между стадиями в режиме --stream (backpressure)
+QUEUE_DB_PATH = Path(".queue.db")  # задания main.py --distributed / --worker; для нескольких машин - на общем томе
+QUEUE_WORKER_THREADS = 8  # сколько заданий один процесс-воркер выполняет одновременно
+QUEUE_LEASE_SECONDS = 120  # аренда задания; не продленную heartbeat'ом аренду забирает другой воркер
+QUEUE_HEARTBEAT_INTERVAL = 20  # сек
+QUEUE_MAX_ATTEMPTS = 3  # после стольких аренд задание считается проваленным
+QUEUE_POLL_INTERVAL = 0.5  # сек, как часто проверять очередь, когда заданий нет
 
 # Можно будет потом поменять на thresholds
 FEEDS_COUNT_AFTER_TITLE_AND_CONTENT_FILTER = 50  # алерты, в которых модель уверена, что они релевантны
 FEEDS_COUNT_CONFUSED = 10  # алерты, в которых модель не уверена
+DEDUP_NUM_PERM = 32  # длина MinHash-сигнатуры
+DEDUP_BANDS = 8  # LSH-полосы (по DEDUP_NUM_PERM / DEDUP_BANDS значений в каждой)
+DEDUP_MIN_SIMILARITY = 0.7  # алерты с похожестью по Жаккару >= порога считаем одной новостью
+PREFILTER_MIN_SCORE = 1  # сколько разных ключевых слов из WHAT_IS_IMPORTANT нужно, чтобы алерт ушел в LLM
+SNIPPET_FAST_PATH = True  # не качать страницу, если сниппета из фида достаточно для второго фильтра
+SNIPPET_MIN_CHARS = 150  # очищенные title + сниппет не короче
+SNIPPET_MIN_TOKENS = 30
+SNIPPET_MIN_KEYWORD_DENSITY = 0.03  # вхождений ключевых слов WHAT_IS_IMPORTANT на слово
+FIRST_FILTER_CHUNK_TOKENS = 30_000  # размер одного запроса первого фильтра (токены), куски шлются параллельно
+SECOND_FILTER_BATCH = True  # второй фильтр несколькими статьями за запрос (BATCH_FILTER_BY_TEXT_PROMPT, JSON-схема)
+SECOND_FILTER_BATCH_TOKENS = 6_000  # бюджет статей одного такого запроса
+SECOND_FILTER_BATCH_MAX_ITEMS = 15  # и не больше стольких статей: ответ тоже должен влезть
 
 WHAT_IS_IMPORTANT = """
 Below I will give you a description of what I'm interested in.
@@ -88,3 +173,22 @@ Example is following:
     WHAT_IS_IMPORTANT=WHAT_IS_IMPORTANT,
 )
 
+BATCH_FILTER_BY_TEXT_PROMPT = """
+You are a helpful assistant and your goal is to filter alerts that are relevant to the user's interests.
+Here you are given a JSON list of articles, each with an "id" and a "text".
+For every article return an object with its "id" and "relevant" (true or false). For relevant articles also add a rewritten "title" and a short "summary" of the news.
+Return exactly one object per input id, do not skip or merge articles, do not invent ids.
+Title and summary needs to be in Russian language. Factually correct, grammatically correct, without any additional information. Just summarization. Title needs to be a full rich sentence. Summary needs to be 2-3 sentences.
+
+Example of one object:
+{{
+    "id": "1a2b3c4d",
+    "relevant": true,
+    "title": "Вышел новый отчет о влиянии генеративного ИИ на рынок труда.",
+    "summary": "Новый отчет Budget Lab при Йельском университете и Института Брукингса анализирует влияние генеративного ИИ на рынок труда с момента запуска ChatGPT в ноябре 2022 года. Отчет показывает стабильность, а не масштабные сокращения, вопреки распространенным опасениям. Авторы подчеркивают важность постоянного мониторинга и призывают ведущие ИИ-компании (такие как Google, Microsoft, OpenAI и Anthropic) прозрачно и ответственно делиться данными об использовании ИИ, чтобы политики могли принимать обоснованные решения относительно будущего труда."
+}}
+
+{WHAT_IS_IMPORTANT}
+""".format(
+    WHAT_IS_IMPORTANT=WHAT_IS_IMPORTANT,
+)
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from google import genai
+from google.genai import types
+
+from constants import CONTEXT_CACHE_PATH, CONTEXT_CACHE_REFRESH_MARGIN, CONTEXT_CACHE_RETRY_AFTER, CONTEXT_CACHE_TTL
+from llm_cache import sha256
+
+
+class ContextCache:
+    """ Кэши контекста Gemini (caches.create) для статичных system prompt.
+
+    Промпт загружается в кэш один раз, дальше запросы ссылаются на него по имени: входные токены
+    промпта не пересылаются и тарифицируются по цене кэша. Имя и срок жизни хранятся по
+    (модель, хэш промпта) в CONTEXT_CACHE_PATH, так что кэш переживает запуски; изменился промпт -
+    другой хэш и новый кэш, старый сам истечет через TTL. Если бэкенд (прокси) кэш не создал,
+    это тоже запоминается, и промпт уходит с запросами как раньше до следующей попытки. """
+
+    def __init__(self, path: Path = CONTEXT_CACHE_PATH, ttl: float = CONTEXT_CACHE_TTL,
+                 refresh_margin: float = CONTEXT_CACHE_REFRESH_MARGIN, retry_after: float = CONTEXT_CACHE_RETRY_AFTER):
+        self.path = path
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        # ключ -> {"name": имя кэша или None (кэш недоступен), "expire": unix time}
+        self._entries: Dict[str, dict] = self._load()
+
+    @staticmethod
+    def key(model: str, system_prompt: str) -> str:
+        return f"{model}:{sha256(system_prompt)}"
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            return json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self) -> None:
+        now = time.time()
+        self._entries = {key: entry for key, entry in self._entries.items() if entry["expire"] > now}
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self._entries, indent=4))
+        tmp_path.replace(self.path)
+
+    def _fresh(self, entry: Optional[dict], now: float) -> bool:
+        return entry is not None and entry["expire"] - self.refresh_margin > now
+
+    def get(self, client: genai.Client, model: str, system_prompt: str) -> Optional[str]:
+        """ имя кэша с этим промптом, при необходимости создает или продлевает его; None - кэша нет """
+        key = self.key(model, system_prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if self._fresh(entry, time.time()):
+                return entry["name"]
+            # кэш мог уже создать или продлить другой процесс (воркер --worker, предыдущий запуск)
+            saved = self._load().get(key)
+            now = time.time()
+            if self._fresh(saved, now):
+                entry = saved
+            else:
+                entry = self._refresh(client, model, system_prompt, saved or entry, now)
+            self._entries[key] = entry
+            self._save()
+            return entry["name"]
+
+    def _refresh(self, client: genai.Client, model: str, system_prompt: str,
+                 entry: Optional[dict], now: float) -> dict:
+        ttl = f"{int(self.ttl)}s"
+        if entry is not None and entry["name"] and entry["expire"] > now:
+            try:
+                cached = client.caches.update(name=entry["name"], config=types.UpdateCachedContentConfig(ttl=ttl))
+                return self._entry(cached, now)
+            except Exception as e:
+                print(f"Context cache {entry['name']} refresh failed ({e}), creating a new one")
+        try:
+            cached = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    display_name=f"prompt-{sha256(system_prompt)[:12]}",
+                    ttl=ttl,
+                ),
+            )
+        except Exception as e:
+            print(f"Context cache is not available ({e}), system prompt goes with every request")
+            return {"name": None, "expire": now + self.retry_after}
+        print(f"Context cache {cached.name} created for {model}")
+        return self._entry(cached, now)
+
+    def _entry(self, cached: types.CachedContent, now: float) -> dict:
+        expire = cached.expire_time.timestamp() if cached.expire_time else now + self.ttl
+        return {"name": cached.name, "expire": expire}
+
+    def invalidate(self, model: str, system_prompt: str) -> None:
+        """ бэкенд не принял кэш в запросе: до следующей попытки промпт шлем сам """
+        with self._lock:
+            self._entries[self.key(model, system_prompt)] = {"name": None, "expire": time.time() + self.retry_after}
+            self._save()
@@ -0,0 +1,232 @@
+""" Резидентный режим: python daemon.py
+
+Процесс живет постоянно и опрашивает каждый фид по своему расписанию, а не все разом по cron.
+Интервал фида подстраивается под то, как часто в нем появляются новые записи
+(цель - ~DAEMON_TARGET_NEW_PER_POLL новых за опрос), в пределах DAEMON_MIN/MAX_INTERVAL.
+Фиды, которым пора опрашиваться в ближайшие DAEMON_BATCH_WINDOW сек, берутся одной пачкой,
+и если пришли новые алерты - по ним прогоняются стадии 2-5 (main.process_alerts).
+
+Все тяжелое поднимается один раз на процесс: HTTP-пул и пул extraction (fetcher),
+браузер, клиент Gemini, кодировка tiktoken, LLM-кэш и ledger. """
+import argparse
+import datetime
+import json
+import signal
+import threading
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import main
+from checkpoint import STAGES
+from constants import (
+    ALERTS_FOLDER,
+    DAEMON_BATCH_WINDOW,
+    DAEMON_DEFAULT_INTERVAL,
+    DAEMON_MAX_INTERVAL,
+    DAEMON_MIN_INTERVAL,
+    DAEMON_RATE_SMOOTHING,
+    DAEMON_TARGET_NEW_PER_POLL,
+    FEED_SCHEDULE_PATH,
+    RSS_LINKS,
+)
+from llm import get_client
+from rss import fetch_feeds
+from journal import RunJournal
+from token_accounting import accountant, get_encoding
+from tracing import tracer
+
+
+@dataclass
+class FeedSchedule:
+    interval: float = DAEMON_DEFAULT_INTERVAL
+    next_poll: float = 0.0
+    last_poll: float = 0.0
+    rate: float = 0.0  # новых записей в секунду, скользящее среднее
+
+
+def published_rate(alerts: List[dict]) -> Optional[float]:
+    """ частота записей по датам published - для первого опроса, когда сравнивать еще не с чем """
+    stamps = []
+    for alert in alerts:
+        try:
+            stamps.append(datetime.datetime.fromisoformat(alert["published"].replace("Z", "+00:00")).timestamp())
+        except (KeyError, ValueError, AttributeError):
+            continue
+    if len(stamps) < 2 or max(stamps) <= min(stamps):
+        return None
+    return (len(stamps) - 1) / (max(stamps) - min(stamps))
+
+
+class Scheduler:
+    """ Расписание опроса фидов, переживает перезапуск процесса (FEED_SCHEDULE_PATH). """
+
+    def __init__(self, feeds: Dict[str, str], path: Path = FEED_SCHEDULE_PATH):
+        self.path = path
+        try:
+            saved = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            saved = {}
+
+        now = time.time()
+        self.feeds: Dict[str, FeedSchedule] = {}
+        for name in feeds:
+            if name in saved:
+                self.feeds[name] = FeedSchedule(**saved[name])
+            else:
+                # новые фиды размазываем по первому интервалу, чтобы не бить по хосту все сразу;
+                # смещение детерминированное - после перезапуска тот же порядок
+                offset = zlib.crc32(name.encode()) % DAEMON_MIN_INTERVAL
+                self.feeds[name] = FeedSchedule(next_poll=now + offset)
+
+    def due(self, now: float, window: float = DAEMON_BATCH_WINDOW) -> List[str]:
+        return [name for name, schedule in self.feeds.items() if schedule.next_poll <= now + window]
+
+    def next_wakeup(self) -> float:
+        return min((schedule.next_poll for schedule in self.feeds.values()), default=time.time() + DAEMON_MAX_INTERVAL)
+
+    def observe(self, name: str, new_count: int, alerts: Optional[List[dict]], now: float) -> None:
+        """ alerts=None - фид не изменился (304) """
+        schedule = self.feeds[name]
+        if schedule.last_poll:
+            observed = new_count / max(now - schedule.last_poll, 1.0)
+            schedule.rate = DAEMON_RATE_SMOOTHING * observed + (1 - DAEMON_RATE_SMOOTHING) * schedule.rate
+        else:
+            schedule.rate = published_rate(alerts or []) or 0.0
+
+        if schedule.rate > 0:
+            interval = DAEMON_TARGET_NEW_PER_POLL / schedule.rate
+        else:
+            # ничего нового - постепенно реже
+            interval = schedule.interval * 2
+        if schedule.last_poll and alerts and new_count >= len(alerts):
+            # новыми оказались все записи фида: часть могла выпасть, не дождавшись нас
+            interval = min(interval, schedule.interval / 2)
+
+        schedule.interval = min(max(interval, DAEMON_MIN_INTERVAL), DAEMON_MAX_INTERVAL)
+        schedule.last_poll = now
+        schedule.next_poll = now + schedule.interval
+
+    def failed(self, name: str, now: float) -> None:
+        """ ошибка сети/парсинга: повторяем через минимальный интервал, оценку частоты не трогаем """
+        schedule = self.feeds[name]
+        schedule.next_poll = now + min(schedule.interval, DAEMON_MIN_INTERVAL)
+
+    def save(self) -> None:
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({name: asdict(schedule) for name, schedule in self.feeds.items()}, indent=4))
+        tmp_path.replace(self.path)
+
+
+class Daemon:
+    def __init__(self, stream: bool = True):
+        self.stream = stream
+        self.stop_event = threading.Event()
+        self.scheduler = Scheduler(RSS_LINKS)
+        self.fetcher = None
+
+    def stop(self, *_) -> None:
+        print("Stopping daemon...")
+        self.stop_event.set()
+
+    def warm_up(self) -> None:
+        ALERTS_FOLDER.mkdir(exist_ok=True)
+        # алерты с диска нужны в памяти: по ним дедупликация и перенос одобренных в итог
+        for feed_name in RSS_LINKS:
+            feed_path = (ALERTS_FOLDER / feed_name).with_suffix(".json")
+            if feed_path.exists():
+                main.alert_store.load_feed(feed_path)
+        get_encoding()
+        get_client()
+        self.fetcher = main.open_fetcher()
+        print(f"Daemon started: {len(RSS_LINKS)} feeds, {len(main.alert_store)} alerts on disk")
+
+    def poll(self, feed_names: List[str]) -> Dict[str, List[dict]]:
+        """ {фид: новые алерты} """
+        now = time.time()
+        new_alerts = {}
+        polled = set()
+        for result in fetch_feeds({name: RSS_LINKS[name] for name in feed_names}, ALERTS_FOLDER):
+            polled.add(result.name)
+            if result.not_modified:
+                self.scheduler.observe(result.name, 0, None, now)
+                continue
+            fresh = [alert for alert in result.alerts if alert["id"] not in main.alert_store]
+            feed_path = (ALERTS_FOLDER / result.name).with_suffix(".json")
+            main.alert_store.write_feed(feed_path, result.alerts)
+            self.scheduler.observe(result.name, len(fresh), result.alerts, now)
+            if fresh:
+                new_alerts[result.name] = fresh
+
+        for name in set(feed_names) - polled:
+            self.scheduler.failed(name, now)
+        main.alert_store.save_index()
+        self.scheduler.save()
+        return new_alerts
+
+    def process(self, new_alerts: Dict[str, List[dict]]) -> None:
+        run_id = main.checkpoint_mgr.start_run()
+        tracer.reset()
+        accountant.reset()
+        journal = RunJournal(run_id)
+        main.results.start_run(run_id, int(time.time()))
+        for feed_name, alerts in new_alerts.items():
+            main.results.add_alerts(run_id, feed_name, alerts)
+        new_count = sum(len(alerts) for alerts in new_alerts.values())
+        print(f"Run {run_id}: {new_count} new alerts from {len(new_alerts)} feeds")
+        main.checkpoint_mgr.update_stats(
+            current_stage=STAGES["RSS_FETCH"],
+            stage_progress=1.0,
+            total_alerts=len(main.alert_store),
+            stage_details=f"{new_count} new alerts from {len(new_alerts)} feeds",
+        )
+        try:
+            main.process_alerts(journal, stream=self.stream, fetcher=self.fetcher)
+        except Exception:
+            # упавший тик не продолжается (--resume у демона нет), его алерты возьмет следующий прогон
+            main.results.finish_run(run_id)
+            raise
+        finally:
+            # на успехе журнал уже закрыт в main.finish_run; здесь - чтобы не копить открытые файлы
+            journal.close()
+
+    def run(self) -> None:
+        self.warm_up()
+        try:
+            while not self.stop_event.is_set():
+                due = self.scheduler.due(time.time())
+                if due:
+                    new_alerts = self.poll(due)
+                    print(f"Polled {len(due)} feeds, {len(new_alerts)} with new alerts")
+                    if new_alerts and not self.stop_event.is_set():
+                        try:
+                            self.process(new_alerts)
+                        except Exception as e:
+                            # неудачный тик не роняет процесс: неклассифицированные алерты
+                            # не попали в ledger и будут взяты следующим прогоном
+                            print(f"Error processing new alerts: {e}")
+                            main.checkpoint_mgr.update_stats(error_count=main.checkpoint_mgr.stats.error_count + 1)
+                            main.checkpoint_mgr.flush()
+                wakeup = self.scheduler.next_wakeup()
+                print(f"Next poll at {datetime.datetime.fromtimestamp(wakeup):%H:%M:%S}")
+                self.stop_event.wait(max(wakeup - time.time(), 0))
+        finally:
+            if self.fetcher is not None:
+                main.close_fetcher(self.fetcher)
+            self.scheduler.save()
+            main.checkpoint_mgr.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", action="store_true", help="стадии 2-5 по стадиям, как main.py без --stream")
+    parser.add_argument("--trace", action="store_true", help="писать chrome-trace каждого прогона в .traces/")
+    args = parser.parse_args()
+    tracer.record_events = args.trace
+
+    daemon = Daemon(stream=not args.batch)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
@@ -0,0 +1,88 @@
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from result_store import ResultStore
+
+FINAL_COLUMNS = ["title", "published", "summary", "link"]
+
+
+class DashboardData:
+    """ Данные для app.py с кэшем между обновлениями страницы.
+
+    Один экземпляр на процесс streamlit (st.cache_resource), общий для всех вкладок.
+    Каждое обновление стоит пару stat() и один PRAGMA: чекпоинт перечитывается, только если
+    у файла сменились mtime/size, итог - только если в results.db кто-то что-то записал. """
+
+    def __init__(self, checkpoint_dir: str = ".checkpoints", results: Optional[ResultStore] = None):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.results = results or ResultStore()
+        self._lock = threading.Lock()
+        self._dir_key: Optional[Tuple[int, int]] = None
+        self._latest_path: Optional[Path] = None
+        self._checkpoint_key: Optional[Tuple[str, int, int]] = None
+        self._checkpoint: Optional[Dict[str, Any]] = None
+        self._revision: Optional[int] = None
+        self._final_key: Optional[tuple] = None
+        self._final: Optional[pd.DataFrame] = None
+
+    @staticmethod
+    def _stat_key(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _latest_checkpoint_path(self) -> Optional[Path]:
+        # glob по папке только если в ней появились/переименовались файлы
+        dir_key = self._stat_key(self.checkpoint_dir)
+        if dir_key != self._dir_key or self._latest_path is None:
+            self._dir_key = dir_key
+            self._latest_path = max(
+                self.checkpoint_dir.glob("checkpoint_*.json"), key=lambda x: x.stat().st_mtime, default=None
+            )
+        return self._latest_path
+
+    def checkpoint(self) -> Optional[Dict[str, Any]]:
+        """ статистика последнего запуска (как CheckpointManager.load_latest_checkpoint) """
+        with self._lock:
+            path = self._latest_checkpoint_path()
+            if path is None:
+                return None
+            stat_key = self._stat_key(path)
+            if stat_key is None:
+                # файл пропал между glob и stat - в следующий раз glob заново
+                self._latest_path = None
+                return self._checkpoint
+            key = (path.name, *stat_key)
+            if key != self._checkpoint_key:
+                try:
+                    self._checkpoint = json.loads(path.read_text())
+                    self._checkpoint_key = key
+                except (FileNotFoundError, json.JSONDecodeError):
+                    pass
+            return self._checkpoint
+
+    def latest_run_id(self) -> Optional[str]:
+        with self._lock:
+            path = self._latest_checkpoint_path()
+        return path.stem.removeprefix("checkpoint_") if path else None
+
+    def final(self) -> Optional[pd.DataFrame]:
+        """ итог последнего запуска с результатами; None - результатов еще нет """
+        with self._lock:
+            revision = self.results.revision()
+            if revision == self._revision:
+                return self._final
+            self._revision = revision
+            run_id = self.results.latest_run_id()
+            key = (run_id, *self.results.final_revision(run_id)) if run_id else None
+            if key != self._final_key:
+                self._final_key = key
+                records = self.results.final(run_id) if run_id else []
+                self._final = pd.DataFrame(records, columns=FINAL_COLUMNS) if records else None
+            return self._final
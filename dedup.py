@@ -0,0 +1,112 @@
+import html
+import re
+import string
+from collections import defaultdict
+from itertools import chain
+from typing import Container, Dict, List
+
+import numpy as np
+
+from constants import DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_MIN_SIMILARITY
+
+TAG_RE = re.compile(r"<[^>]+>")
+PUNCTUATION = str.maketrans({char: " " for char in string.punctuation + "«»“”‘’—–…"})
+BATCH_WORDS = 200_000
+
+_rng = np.random.default_rng(42)
+# универсальное хэширование multiply-shift: (a*x + b) mod 2^64, берем старшие 32 бита
+PERM_A = _rng.integers(1, 2 ** 63, size=DEDUP_NUM_PERM, dtype=np.uint64) | np.uint64(1)
+PERM_B = _rng.integers(0, 2 ** 63, size=DEDUP_NUM_PERM, dtype=np.uint64)
+
+
+def alert_text(alert: dict) -> str:
+    """ title + очищенный от тегов сниппет из фида """
+    content = alert["content"][0]["value"] if alert.get("content") else ""
+    return f"{alert['title']} {html.unescape(TAG_RE.sub(' ', content))}"
+
+
+def tokenize(text: str) -> List[str]:
+    return text.lower().translate(PUNCTUATION).split()
+
+
+def minhash_signatures(texts: List[str]) -> np.ndarray:
+    """ MinHash по множеству слов каждого текста, shape (len(texts), DEDUP_NUM_PERM).
+    Считается пачками для всех текстов сразу, без питоновского цикла по перестановкам.
+    hash() строк рандомизирован между процессами, но внутри одного запуска стабилен - нам этого хватает. """
+    # пустой текст получает уникальное "слово" и ни с кем не совпадет
+    words = [tokenize(text) or [f"\0{idx}"] for idx, text in enumerate(texts)]
+    lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    hashes = np.fromiter(map(hash, chain.from_iterable(words)), dtype=np.int64, count=int(lengths.sum())).view(np.uint64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    signatures = np.empty((len(texts), DEDUP_NUM_PERM), dtype=np.uint64)
+    start = 0
+    while start < len(texts):
+        # пачка текстов, в которой примерно BATCH_WORDS слов (ограничивает память)
+        end = max(int(np.searchsorted(offsets, offsets[start] + BATCH_WORDS, side="right")) - 1, start + 1)
+        batch = hashes[offsets[start]:offsets[end]]
+        # (перестановки, слова): reduceat по последней оси идет по непрерывной памяти
+        permuted = (PERM_A[:, None] * batch + PERM_B[:, None]) >> np.uint64(32)
+        signatures[start:end] = np.minimum.reduceat(permuted, offsets[start:end] - offsets[start], axis=1).T
+        start = end
+    return signatures
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int) -> None:
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[b] = a
+
+
+def cluster_alerts(
+    alerts: List[dict],
+    preferred: Container[str] = (),
+    min_similarity: float = DEDUP_MIN_SIMILARITY,
+) -> Dict[str, List[str]]:
+    """ Группирует почти-дубликаты по MinHash (title + content).
+    Кандидаты - алерты, у которых совпала хотя бы одна LSH-полоса сигнатуры,
+    дальше проверяем оценку Жаккара >= min_similarity.
+    Возвращает {id представителя: [id представителя, остальные id кластера]}.
+    Представитель - алерт из preferred (уже обработанный раньше), иначе с самым длинным текстом. """
+    if not alerts:
+        return {}
+    texts = [alert_text(alert) for alert in alerts]
+    signatures = minhash_signatures(texts)
+
+    rows = DEDUP_NUM_PERM // DEDUP_BANDS
+    uf = _UnionFind(len(alerts))
+    for band in range(DEDUP_BANDS):
+        # склеиваем значения полосы в один ключ и сортируем: одинаковые ключи оказываются рядом,
+        # и питоновский цикл идет только по совпадениям
+        keys = np.zeros(len(alerts), dtype=np.uint64)
+        for column in signatures[:, band * rows:(band + 1) * rows].T:
+            keys = keys * np.uint64(0x100000001B3) ^ column
+        order = np.argsort(keys, kind="stable")
+        same_as_prev = np.flatnonzero(keys[order][1:] == keys[order][:-1]) + 1
+        for pos in same_as_prev:
+            first, other = int(order[pos - 1]), int(order[pos])
+            if uf.find(first) == uf.find(other):
+                continue
+            if np.count_nonzero(signatures[first] == signatures[other]) >= min_similarity * DEDUP_NUM_PERM:
+                uf.union(first, other)
+
+    groups = defaultdict(list)
+    for idx in range(len(alerts)):
+        groups[uf.find(idx)].append(idx)
+
+    clusters = {}
+    for members in groups.values():
+        rep = max(members, key=lambda idx: (alerts[idx]["id"] in preferred, len(texts[idx])))
+        ids = [alerts[rep]["id"]] + [alerts[idx]["id"] for idx in members if idx != rep]
+        clusters[ids[0]] = ids
+    return clusters
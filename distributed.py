@@ -0,0 +1,158 @@
+""" Один запуск на несколько процессов/машин через WorkQueue (workqueue.py).
+
+Координатор (python main.py --distributed) ведет стадии как обычно, но фиды, страницы
+и суммаризацию не выполняет сам, а ставит заданиями в очередь и собирает результаты.
+Воркеры (python main.py --worker [RUN_ID]) берут задания в аренду, в том числе на других
+машинах, если QUEUE_DB_PATH лежит на общем томе. Координатор тоже работает воркером. """
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+from constants import QUEUE_HEARTBEAT_INTERVAL, QUEUE_POLL_INTERVAL, QUEUE_WORKER_THREADS
+from tracing import tracer
+from workqueue import DONE, Job, WorkQueue, worker_id
+
+# kind задания -> handler(key, payload) -> json-сериализуемый результат
+Handlers = Dict[str, Callable[[str, dict], object]]
+
+
+class QueueWorker:
+    """ Выполняет задания в threads потоках и раз в QUEUE_HEARTBEAT_INTERVAL продлевает аренды.
+    run_id=None - обслуживать последний открытый запуск (долгоживущий воркер),
+    иначе - только этот запуск, до его закрытия. """
+
+    def __init__(self, queue: WorkQueue, handlers: Handlers, run_id: Optional[str] = None,
+                 threads: int = QUEUE_WORKER_THREADS, on_stop: Optional[Callable[[], None]] = None):
+        self.queue = queue
+        self.handlers = handlers
+        self.run_id = run_id
+        self.threads = threads
+        self.on_stop = on_stop  # освободить то, на чем работают handlers (fetcher)
+        self.worker = worker_id()
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._runs = set()  # запуски, по которым этот воркер отчитывается heartbeat'ом
+        self._dirty = False  # есть счетчики, еще не опубликованные heartbeat'ом
+        self._threads = []
+
+    def start(self) -> "QueueWorker":
+        self._threads = [threading.Thread(target=self._loop, daemon=True) for _ in range(self.threads)]
+        self._threads.append(threading.Thread(target=self._heartbeat_loop, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._stop.is_set() and not self._threads:
+            return
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._heartbeat()
+        if self.on_stop is not None:
+            self.on_stop()
+
+    def wait(self) -> None:
+        """ до stop() или закрытия своего запуска """
+        while not self._stop.wait(QUEUE_POLL_INTERVAL):
+            if self.run_id is not None and not self.queue.is_open(self.run_id):
+                break
+        self.stop()
+
+    def _current_run(self) -> Optional[str]:
+        if self.run_id is not None:
+            return self.run_id if self.queue.is_open(self.run_id) else None
+        return self.queue.latest_open_run()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._step()
+            except Exception as e:
+                # сбой самой очереди (блокировка, общий том): задание вернется по истечении аренды
+                print(f"Queue error: {e}")
+                self._stop.wait(QUEUE_POLL_INTERVAL)
+
+    def _step(self) -> None:
+        run_id = self._current_run()
+        jobs = self.queue.lease(run_id, self.worker) if run_id else []
+        if not jobs:
+            # очередь опустела: публикуем счетчики сразу, не дожидаясь планового heartbeat
+            if self._dirty:
+                self._heartbeat()
+            self._stop.wait(QUEUE_POLL_INTERVAL)
+            return
+        with self._lock:
+            self._runs.add(run_id)
+        self._execute(jobs[0])
+
+    def _execute(self, job: Job) -> None:
+        started = time.perf_counter()
+        try:
+            with tracer.span(f"queue.{job.kind}", job.key):
+                result = self.handlers[job.kind](job.key, job.payload)
+        except Exception as e:
+            print(f"Job {job.kind}/{job.key} failed (attempt {job.attempts}): {e}")
+            self.queue.fail(job, self.worker, str(e))
+            outcome = "errors"
+        else:
+            outcome = job.kind if self.queue.complete(job, self.worker, result) else "lost_leases"
+        with self._lock:
+            self.stats[outcome] += 1
+            self.stats["busy_seconds"] += round(time.perf_counter() - started, 3)
+            self._dirty = True
+
+    def _heartbeat(self) -> None:
+        with self._lock:
+            runs = list(self._runs)
+            stats = dict(self.stats)
+            self._dirty = False
+        for run_id in runs:
+            self.queue.heartbeat(run_id, self.worker, stats)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(QUEUE_HEARTBEAT_INTERVAL):
+            try:
+                self._heartbeat()
+            except Exception as e:
+                # пропущенный heartbeat не страшен, пока аренда не истекла
+                print(f"Heartbeat failed: {e}")
+
+
+class Coordinator:
+    """ Раздает задания стадии и отдает результаты по мере готовности, как generate_many. """
+
+    def __init__(self, queue: WorkQueue, run_id: str, worker: QueueWorker,
+                 on_rollup: Optional[Callable[[dict], None]] = None):
+        self.queue = queue
+        self.run_id = run_id
+        self.worker = worker
+        self.on_rollup = on_rollup
+
+    def map(self, kind: str, payloads: Dict[str, dict]) -> Iterator[Tuple[str, Union[object, Exception]]]:
+        """ (key, результат); для проваленного задания вместо результата - исключение """
+        self.queue.enqueue(self.run_id, kind, payloads)
+        remaining = set(payloads)
+        cursor = 0
+        while remaining:
+            finished = self.queue.finished(self.run_id, kind, after=cursor)
+            for cursor, key, state, result, error in finished:
+                if key not in remaining:
+                    continue
+                remaining.discard(key)
+                yield key, result if state == DONE else RuntimeError(error)
+            if self.on_rollup is not None:
+                self.on_rollup(self.queue.rollup(self.run_id))
+            if remaining and not finished:
+                time.sleep(QUEUE_POLL_INTERVAL)
+
+    def close(self) -> dict:
+        """ закрывает запуск (воркеры с --worker RUN_ID завершатся) и возвращает итоговый rollup """
+        self.queue.close_run(self.run_id)
+        self.worker.stop()
+        # остальные воркеры публикуют последние счетчики, как только видят пустую очередь
+        time.sleep(2 * QUEUE_POLL_INTERVAL)
+        return self.queue.rollup(self.run_id)
@@ -0,0 +1,68 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+import trafilatura
+import justext
+from bs4 import BeautifulSoup
+
+from constants import EXTRACT_WORKERS, EXTRACT_TIMEOUT, MAX_HTML_CHARS
+
+
+def clean_html(html: str) -> str:
+    """ clean html here. if fallbacks:
+    trafilatura -> justext -> bs4 -> raw html"""
+    # одна огромная страница не должна подвесить воркер
+    html = html[:MAX_HTML_CHARS]
+
+    try:
+        text = trafilatura.extract(html, favor_recall=True)
+        if text:
+            return text
+    except Exception as e:
+        print(f"Error cleaning html with trafilatura: {e}")
+
+    try:
+        paragraphs = justext.justext(html, justext.get_stoplist("English"))
+        text = "\n".join(p.text for p in paragraphs if not p.is_boilerplate)
+        if text:
+            return text
+    except Exception as e:
+        print(f"Error cleaning html with jusText: {e}")
+
+    try:
+        return BeautifulSoup(html, "html.parser").get_text(" ", strip=True)
+    except Exception as e:
+        print(f"Error cleaning html with bs4: {e}")
+
+    return html
+
+
+class Extractor:
+    """ Чистка html в пуле процессов: trafilatura/justext/bs4 упираются в CPU,
+    и из-за GIL в потоках фетчера они не параллелятся.
+    workers=0 -> чистим прямо в вызывающем потоке. """
+
+    def __init__(self, workers: int = EXTRACT_WORKERS, timeout: float = EXTRACT_TIMEOUT):
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        if workers:
+            # воркеры создаются лениво из потоков фетчера, а fork многопоточного процесса небезопасен
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver") if "forkserver" in methods else None
+            self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+    def submit(self, html: str) -> Future:
+        if self._pool is None:
+            future = Future()
+            future.set_result(clean_html(html))
+            return future
+        # режем до отправки, чтобы не гонять мегабайты между процессами
+        return self._pool.submit(clean_html, html[:MAX_HTML_CHARS])
+
+    def extract(self, html: str) -> str:
+        return self.submit(html).result(timeout=self.timeout)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
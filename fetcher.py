@@ -0,0 +1,227 @@
+import queue
+import re
+import threading
+from typing import Optional, Tuple
+
+import urllib3
+from selenium import webdriver
+
+from constants import (
+    FETCH_BACKEND,
+    FETCH_TIMEOUT,
+    FETCH_WORKERS,
+    FETCH_MAX_BYTES,
+    FETCH_HTML_TYPES,
+    EXTRACT_STEP_CHARS,
+    BROWSER,
+    BROWSER_POOL_SIZE,
+    JS_SHELL_MIN_TEXT,
+)
+from extraction import Extractor
+from token_accounting import truncate_tokens
+from tracing import tracer
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/124.0 Safari/537.36"
+)
+
+JS_SHELL_MARKERS = re.compile(
+    r"enable javascript|javascript is (?:disabled|required)|<noscript|id=\"(?:root|app|__next)\"",
+    re.IGNORECASE,
+)
+
+CHARSET = re.compile(r"charset=[\"']?([\w-]+)", re.IGNORECASE)
+
+
+class UnsupportedContent(Exception):
+    """ по ссылке не html (pdf, видео, ...): браузер тут тоже не поможет """
+
+
+def looks_like_js_shell(html: str, text: str) -> bool:
+    """ страница, которая рендерится джаваскриптом: текста почти нет """
+    text = text.strip()
+    if not text:
+        return True
+    return len(text) < JS_SHELL_MIN_TEXT and bool(JS_SHELL_MARKERS.search(html))
+
+
+class HttpFetcher:
+    """ обычный HTTP с пулом keep-alive соединений """
+
+    def __init__(self, pool_size: int = FETCH_WORKERS, timeout: float = FETCH_TIMEOUT,
+                 max_bytes: int = FETCH_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.http = urllib3.PoolManager(
+            num_pools=64,
+            maxsize=pool_size,
+            block=False,
+            timeout=urllib3.Timeout(total=timeout, connect=timeout, read=timeout),
+            retries=urllib3.Retry(total=2, redirect=5, backoff_factor=0.3),
+            headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+        )
+
+    def fetch(self, link: str) -> str:
+        """ тело читается потоком: не html отбрасываем по заголовкам, больше max_bytes не читаем """
+        with tracer.span("http.get", link):
+            response = self.http.request("GET", link, preload_content=False)
+            complete = False
+            try:
+                if response.status >= 400:
+                    raise RuntimeError(f"HTTP {response.status} for {link}")
+                content_type = response.headers.get("Content-Type", "")
+                mime = content_type.split(";")[0].strip().lower()
+                if mime and mime not in FETCH_HTML_TYPES:
+                    raise UnsupportedContent(f"{mime} at {link}")
+                body, complete = self._read(response)
+            finally:
+                if complete:
+                    response.release_conn()
+                else:
+                    # соединение с недочитанным телом в пул не возвращаем
+                    response.close()
+        charset = CHARSET.search(content_type)
+        return body.decode(charset.group(1) if charset else "utf-8", errors="replace")
+
+    def _read(self, response) -> Tuple[bytes, bool]:
+        """ (тело, дочитано ли до конца) """
+        body = bytearray()
+        for chunk in response.stream(64 * 1024):
+            body += chunk
+            if len(body) >= self.max_bytes:
+                return bytes(body[:self.max_bytes]), False
+        return bytes(body), True
+
+    def close(self) -> None:
+        self.http.clear()
+
+
+def create_driver(browser: str = BROWSER, timeout: float = FETCH_TIMEOUT) -> webdriver.Remote:
+    if browser == "chrome":
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        driver = webdriver.Chrome(options=options)
+    elif browser == "firefox":
+        options = webdriver.FirefoxOptions()
+        options.add_argument("-headless")
+        driver = webdriver.Firefox(options=options)
+    elif browser == "safari":
+        driver = webdriver.Safari()
+    else:
+        raise ValueError(f"Unknown browser {browser}")
+    driver.set_page_load_timeout(timeout)
+    return driver
+
+
+class BrowserPool:
+    """ пул долгоживущих headless-браузеров, которые делят между собой воркеры.
+    Драйверы создаются лениво, не больше size штук. """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, browser: str = BROWSER):
+        self.size = size
+        self.browser = browser
+        self._idle = queue.Queue()
+        # слоты - драйверы в работе; драйвер создается, только когда слот взят, а свободных нет,
+        # так что всего их не больше size. Упавший драйвер освобождает слот, и ждущий создаст новый
+        self._slots = threading.Semaphore(size)
+
+    def _acquire(self) -> webdriver.Remote:
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return create_driver(self.browser)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _discard(self, driver: webdriver.Remote) -> None:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def fetch(self, link: str) -> str:
+        driver = self._acquire()
+        try:
+            with tracer.span("driver.get", link):
+                driver.get(link)
+                html = driver.page_source
+        except Exception:
+            # после ошибки драйвер может быть в непонятном состоянии - не возвращаем его в пул
+            self._discard(driver)
+            self._slots.release()
+            raise
+        self._idle.put(driver)
+        self._slots.release()
+        return html
+
+    def close(self) -> None:
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+
+
+class ContentFetcher:
+    """ Достает и чистит текст страницы.
+    backend="http": обычный HTTP, браузер только если текст пустой или страница - JS-оболочка
+    backend="browser": всегда через пул браузеров
+    Сырой html уходит на чистку в Extractor (пул процессов). """
+
+    def __init__(self, backend: str = FETCH_BACKEND, extractor: Optional[Extractor] = None):
+        if backend not in ("http", "browser"):
+            raise ValueError(f"Unknown fetch backend {backend}")
+        self.backend = backend
+        self.extractor = extractor or Extractor(workers=0)
+        self.http = HttpFetcher() if backend == "http" else None
+        self._browsers: Optional[BrowserPool] = None
+        self._browsers_lock = threading.Lock()
+
+    @property
+    def browsers(self) -> BrowserPool:
+        with self._browsers_lock:
+            if self._browsers is None:
+                self._browsers = BrowserPool()
+            return self._browsers
+
+    def extract(self, html: str, link: str, token_budget: Optional[int] = None) -> str:
+        """ token_budget: нужен только первый кусок текста - чистим начало html
+        (EXTRACT_STEP_CHARS, затем вчетверо больше), пока текста не наберется на бюджет """
+        if token_budget is None:
+            with tracer.span("extract", link):
+                return self.extractor.extract(html)
+        size = EXTRACT_STEP_CHARS
+        while True:
+            with tracer.span("extract", link):
+                text = self.extractor.extract(html[:size])
+            text, reached = truncate_tokens(text, token_budget)
+            if reached or size >= len(html):
+                return text
+            size *= 4
+
+    def fetch_text(self, link: str, token_budget: Optional[int] = None) -> str:
+        if self.backend == "http":
+            try:
+                html = self.http.fetch(link)
+                text = self.extract(html, link, token_budget)
+                if not looks_like_js_shell(html, text):
+                    return text
+            except UnsupportedContent:
+                raise
+            except Exception as e:
+                print(f"HTTP fetch failed for {link}, falling back to browser: {e}")
+        html = self.browsers.fetch(link)
+        return self.extract(html, link, token_budget)
+
+    def close(self) -> None:
+        if self.http is not None:
+            self.http.close()
+        if self._browsers is not None:
+            self._browsers.close()
@@ -0,0 +1,212 @@
+import hashlib
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from constants import (
+    FILTER_BY_TITLE_AND_CONTENT_PROMPT,
+    FEEDS_COUNT_AFTER_TITLE_AND_CONTENT_FILTER,
+    FEEDS_COUNT_CONFUSED,
+    FILTER_BY_TEXT_PROMPT,
+    BATCH_FILTER_BY_TEXT_PROMPT,
+    SECOND_FILTER_BATCH_TOKENS,
+    SECOND_FILTER_BATCH_MAX_ITEMS,
+    LLM_MAX_IN_FLIGHT,
+)
+from llm import generate, generate_many, parse_json_response, discard_cached
+from journal import RunJournal, CHUNK
+from token_accounting import accountant
+
+
+def count_tokens_per_item(payload: List[dict]) -> List[int]:
+    return accountant.count_items(payload)
+
+
+def chunk_by_tokens(payload: List[dict], token_counts: List[int], budget: int,
+                    max_items: Optional[int] = None) -> List[List[dict]]:
+    """ режем payload на куски не больше budget токенов (алерт больше бюджета идет отдельным куском)
+    и, если задано, не больше max_items элементов """
+    chunks, chunk, chunk_tokens = [], [], 0
+    for item, tokens in zip(payload, token_counts):
+        if chunk and (chunk_tokens + tokens > budget or len(chunk) == max_items):
+            chunks.append(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(item)
+        chunk_tokens += tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _round_robin(lists: List[List[str]], limit: int, exclude: set) -> List[str]:
+    """ берем по одному id из каждого куска по очереди, чтобы ни один кусок не забрал весь лимит """
+    result = []
+    for position in range(max((len(ids) for ids in lists), default=0)):
+        for ids in lists:
+            if len(result) >= limit:
+                return result
+            if position < len(ids) and ids[position] not in exclude:
+                exclude.add(ids[position])
+                result.append(ids[position])
+    return result
+
+
+def merge_first_filter_responses(responses: List[dict]) -> Dict[str, List[str]]:
+    seen = set()
+    relevant_ids = _round_robin(
+        [response.get("relevant_ids", []) for response in responses],
+        FEEDS_COUNT_AFTER_TITLE_AND_CONTENT_FILTER,
+        seen,
+    )
+    unsure_ids = _round_robin(
+        [response.get("unsure_ids", []) for response in responses],
+        FEEDS_COUNT_CONFUSED,
+        seen,
+    )
+    return {"relevant_ids": relevant_ids, "unsure_ids": unsure_ids}
+
+
+def iter_first_filter(chunks: List[List[dict]], journal: Optional[RunJournal] = None) -> Iterator[Tuple[int, dict]]:
+    """ Каждый кусок параллельно в LLM; отдает (номер куска, {relevant_ids, unsure_ids}) по мере готовности.
+    Куски, уже записанные в журнал запуска, повторно не отправляются и отдаются первыми. """
+    requests = {str(idx): json.dumps(chunk) for idx, chunk in enumerate(chunks)}
+    chunk_keys = {idx: hashlib.sha256(request.encode()).hexdigest() for idx, request in requests.items()}
+    if journal is not None:
+        for idx, key in chunk_keys.items():
+            if journal.done(CHUNK, key):
+                del requests[idx]
+                yield int(idx), journal.get(CHUNK, key)
+
+    for chunk_idx, text_response in generate_many(FILTER_BY_TITLE_AND_CONTENT_PROMPT, requests):
+        idx = int(chunk_idx)
+        if isinstance(text_response, Exception):
+            raise RuntimeError(f"First filter failed on chunk {idx}: {text_response}") from text_response
+        try:
+            response = parse_json_response(text_response)
+        except ValueError:
+            discard_cached(FILTER_BY_TITLE_AND_CONTENT_PROMPT, requests[chunk_idx])
+            raise
+        # модель иногда возвращает id, которых в куске не было
+        chunk_ids = {item["id"] for item in chunks[idx]}
+        response = {
+            key: [alert_id for alert_id in response.get(key, []) if alert_id in chunk_ids]
+            for key in ("relevant_ids", "unsure_ids")
+        }
+        if journal is not None:
+            journal.record(CHUNK, chunk_keys[chunk_idx], response)
+        yield idx, response
+
+
+def run_first_filter(chunks: List[List[dict]], journal: Optional[RunJournal] = None) -> Dict[str, List[str]]:
+    """ map: куски параллельно в LLM; reduce: сливаем relevant/unsure с глобальными лимитами """
+    responses = [None] * len(chunks)
+    for idx, response in iter_first_filter(chunks, journal):
+        responses[idx] = response
+    return merge_first_filter_responses(responses)
+
+
+# ответ батча второго фильтра: по объекту на каждую статью
+SECOND_FILTER_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "id": {"type": "STRING"},
+            "relevant": {"type": "BOOLEAN"},
+            "title": {"type": "STRING"},
+            "summary": {"type": "STRING"},
+        },
+        "required": ["id", "relevant"],
+    },
+}
+
+# результат второго фильтра по алерту: {"title", "summary"}, пустой список - нерелевантно,
+# исключение - ответа нет
+SecondFilterResult = Union[dict, list, Exception]
+
+
+def parse_second_filter(responses: Iterable[Tuple[str, Union[str, Exception]]],
+                        contents: Dict[str, str]) -> Iterator[Tuple[str, SecondFilterResult]]:
+    """ ответы по одной статье за запрос (generate_many, задания очереди) -> разобранный json """
+    for alert_id, text_response in responses:
+        if isinstance(text_response, Exception):
+            yield alert_id, text_response
+            continue
+        try:
+            yield alert_id, parse_json_response(text_response)
+        except ValueError as e:
+            discard_cached(FILTER_BY_TEXT_PROMPT, contents[alert_id])
+            yield alert_id, ValueError(f"{e}. Text: {text_response}")
+
+
+def second_filter_batches(contents: Dict[str, str]) -> List[List[dict]]:
+    payload = [{"id": alert_id, "text": text} for alert_id, text in contents.items()]
+    token_counts = count_tokens_per_item(payload)
+    return chunk_by_tokens(payload, token_counts, SECOND_FILTER_BATCH_TOKENS, SECOND_FILTER_BATCH_MAX_ITEMS)
+
+
+def summarize_batch(batch: List[dict]) -> Dict[str, SecondFilterResult]:
+    """ один запрос на несколько статей; статьи, которых нет в ответе (или ответ по ним битый),
+    в результат не попадают - их повторит вызывающий """
+    request = json.dumps(batch, ensure_ascii=False)
+    text_response = generate(
+        BATCH_FILTER_BY_TEXT_PROMPT, request, item=f"{batch[0]['id']}+{len(batch) - 1}",
+        response_schema=SECOND_FILTER_SCHEMA,
+    )
+    try:
+        entries = parse_json_response(text_response)
+        if not isinstance(entries, list):
+            raise ValueError(f"expected a list, got {type(entries).__name__}")
+    except ValueError:
+        discard_cached(BATCH_FILTER_BY_TEXT_PROMPT, request, response_schema=SECOND_FILTER_SCHEMA)
+        raise
+
+    ids = {item["id"] for item in batch}
+    results = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get("id") not in ids or "relevant" not in entry:
+            continue
+        if not entry["relevant"]:
+            results[entry["id"]] = []
+        elif entry.get("title") and entry.get("summary"):
+            results[entry["id"]] = {"title": entry["title"], "summary": entry["summary"]}
+    return results
+
+
+def iter_second_filter_batches(batches: List[List[dict]],
+                               max_in_flight: int = LLM_MAX_IN_FLIGHT) -> Iterator[Tuple[str, SecondFilterResult]]:
+    """ Батчи параллельно; (id, результат) по мере готовности.
+    Статьи, которых нет в разобранном ответе (или ответ не разобрался), делятся пополам и отправляются
+    заново, пока не останется одна - тогда вместо результата отдается исключение. Если не прошел
+    сам запрос, исключение сразу отдается по всем статьям батча. """
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        pending = {pool.submit(summarize_batch, batch): batch for batch in batches}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = pending.pop(future)
+                try:
+                    results, error = future.result(), None
+                except ValueError as e:
+                    # ответ пришел, но не разобрался - меньший батч модель скорее ответит целиком
+                    results, error = {}, e
+                except Exception as e:
+                    # сам запрос не прошел (повторы generate на 429/5xx исчерпаны, авторизация, прокси):
+                    # дробление только умножило бы запросы к уже исчерпанной квоте
+                    for item in batch:
+                        yield item["id"], e
+                    continue
+                yield from results.items()
+
+                failed = [item for item in batch if item["id"] not in results]
+                if not failed:
+                    continue
+                if len(batch) == 1:
+                    yield failed[0]["id"], error or ValueError("no valid entry for this id in the reply")
+                    continue
+                print(f"Second filter batch: {len(failed)}/{len(batch)} articles without answer"
+                      f"{f' ({error})' if error else ''}, retrying them in smaller batches")
+                half = (len(failed) + 1) // 2
+                for part in (failed[:half], failed[half:]):
+                    if part:
+                        pending[pool.submit(summarize_batch, part)] = part
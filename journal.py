@@ -0,0 +1,55 @@
+import json
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from constants import JOURNAL_FOLDER
+
+# единицы работы, которые переживают падение/остановку запуска
+FEED = "feed"  # фид скачан и записан в ALERTS_FOLDER
+CHUNK = "chunk"  # кусок первого фильтра получил ответ LLM
+PAGE = "page"  # страница скачана и почищена
+SUMMARY = "summary"  # второй фильтр вернул ответ по алерту
+
+
+class RunJournal:
+    """ Append-only журнал запуска: по строке json на каждую законченную единицу работы.
+    При --resume <run_id> журнал перечитывается, и все, что в нем есть, повторно не делается. """
+
+    def __init__(self, run_id: str, folder: Path = JOURNAL_FOLDER):
+        self.run_id = run_id
+        folder.mkdir(exist_ok=True)
+        self.path = folder / f"{run_id}.jsonl"
+        self._lock = threading.Lock()
+        self._done = {}
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # последняя строка могла не дописаться при падении
+                    continue
+                self._done[(record["kind"], record["key"])] = record.get("data")
+        self._file = open(self.path, "a")
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def done(self, kind: str, key: str) -> bool:
+        with self._lock:
+            return (kind, key) in self._done
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._done.get((kind, key))
+
+    def record(self, kind: str, key: str, data: Any = None) -> None:
+        line = json.dumps({"kind": kind, "key": key, "data": data}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._done[(kind, key)] = data
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from constants import LEDGER_PATH
+from tracing import tracer
+
+# вердикты по алерту
+PREFILTERED = "prefiltered"  # отсеян локальным префильтром по ключевым словам
+REJECTED_FIRST = "rejected_first"  # не прошел первый фильтр
+CANDIDATE = "candidate"  # прошел первый фильтр, второго еще не было (или упал fetch/LLM)
+REJECTED = "rejected"  # второй фильтр вернул пустой ответ
+APPROVED = "approved"  # есть title + summary
+
+
+class Ledger:
+    """ Сквозной между запусками журнал обработанных алертов: id -> вердикт.
+    id стабилен (sha256 от title+published), поэтому следующий запуск гонит
+    через LLM только новые алерты, а одобренные раньше переносит в итог. """
+
+    def __init__(self, path: Path = LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self._entries: Dict[str, dict] = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._entries = {}
+
+    def __contains__(self, alert_id: str) -> bool:
+        with self._lock:
+            return alert_id in self._entries
+
+    def get(self, alert_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._entries.get(alert_id)
+
+    def verdict(self, alert_id: str) -> Optional[str]:
+        entry = self.get(alert_id)
+        return entry["verdict"] if entry else None
+
+    def record(self, alert_id: str, verdict: str, **data) -> None:
+        with self._lock:
+            self._entries[alert_id] = {
+                **self._entries.get(alert_id, {}),
+                "verdict": verdict,
+                "updated": datetime.now().isoformat(),
+                **data,
+            }
+
+    def with_verdict(self, verdict: str, alert_ids: Iterable[str]) -> list:
+        """ те из alert_ids, у которых сейчас такой вердикт (порядок сохраняется) """
+        with self._lock:
+            return [
+                alert_id for alert_id in alert_ids
+                if self._entries.get(alert_id, {}).get("verdict") == verdict
+            ]
+
+    def save(self) -> None:
+        with tracer.span("ledger.save"):
+            with self._lock:
+                data = json.dumps(self._entries, ensure_ascii=False)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(data)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,161 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+from constants import (
+    API_KEY,
+    GEMINI_BASE_URL,
+    GEMINI_MODEL,
+    LLM_MAX_IN_FLIGHT,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_BURST,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    CONTEXT_CACHE,
+    CONTEXT_CACHE_MIN_TOKENS,
+)
+from context_cache import ContextCache
+from ratelimit import TokenBucket
+from llm_cache import LLMCache
+from token_accounting import accountant
+from tracing import tracer
+
+_client = None
+_client_lock = threading.Lock()
+
+# квота прокси общая на весь процесс
+rate_limiter = TokenBucket(rate=LLM_REQUESTS_PER_MINUTE / 60, capacity=LLM_BURST)
+cache = LLMCache()
+context_cache = ContextCache()
+
+
+def get_client() -> genai.Client:
+    """ один клиент (и один пул соединений) на весь процесс """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = genai.Client(api_key=API_KEY, http_options={"base_url": GEMINI_BASE_URL})
+        return _client
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, errors.APIError):
+        return error.code == 429 or (error.code or 0) >= 500
+    # google-genai ходит через httpx: обрывы и таймауты - httpx.TransportError, не встроенные ConnectionError
+    return isinstance(error, httpx.TransportError)
+
+
+def cache_prompt(system_prompt: str, response_schema: Optional[dict] = None) -> str:
+    """ ответ в JSON-режиме по схеме - другой ответ, ключ кэша тоже другой """
+    if response_schema is None:
+        return system_prompt
+    return f"{system_prompt}\0{json.dumps(response_schema, sort_keys=True)}"
+
+
+def cached_context(system_prompt: str, model: str = GEMINI_MODEL) -> Optional[str]:
+    """ имя кэша контекста с этим system prompt (создается/продлевается здесь же, до веера запросов);
+    None - промпт уходит с каждым запросом: кэш выключен, промпт короче минимума Gemini или бэкенд не умеет """
+    if not CONTEXT_CACHE or accountant.count([system_prompt])[0] < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    return context_cache.get(get_client(), model, system_prompt)
+
+
+def generation_config(system_prompt: str, response_schema: Optional[dict] = None,
+                      cached_content: Optional[str] = None) -> types.GenerateContentConfig:
+    json_mode = {}
+    if response_schema is not None:
+        json_mode = {"response_mime_type": "application/json", "response_schema": response_schema}
+    if cached_content is not None:
+        # system prompt уже лежит в кэше, вместе с cached_content передавать его нельзя
+        return types.GenerateContentConfig(cached_content=cached_content, **json_mode)
+    return types.GenerateContentConfig(system_instruction=system_prompt, **json_mode)
+
+
+def request_content(system_prompt: str, contents: str, model: str, item: Optional[str],
+                    response_schema: Optional[dict]) -> types.GenerateContentResponse:
+    """ один запрос к Gemini: через кэш контекста, если он есть, иначе (или если бэкенд его не принял) - с промптом """
+    cached_content = cached_context(system_prompt, model)
+    if cached_content is not None:
+        try:
+            with tracer.span("generate_content", item):
+                return get_client().models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=generation_config(system_prompt, response_schema, cached_content),
+                )
+        except errors.APIError as e:
+            # кэш удален/истек на сервере раньше срока или прокси не пропускает cached_content
+            if e.code not in (400, 403, 404):
+                raise
+            print(f"Context cache {cached_content} rejected ({e}), sending the system prompt")
+            context_cache.invalidate(model, system_prompt)
+    with tracer.span("generate_content", item):
+        return get_client().models.generate_content(
+            model=model,
+            contents=contents,
+            config=generation_config(system_prompt, response_schema),
+        )
+
+
+def generate(system_prompt: str, contents: str, model: str = GEMINI_MODEL, item: Optional[str] = None,
+             response_schema: Optional[dict] = None) -> str:
+    """ generate_content с кэшем, rate limit и повторами на 429/5xx (экспоненциальный backoff с jitter).
+    item - id алерта/куска для трейсинга; response_schema - JSON-режим, ответ строго по схеме """
+    key = cache.key(model, cache_prompt(system_prompt, response_schema), contents)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            response = request_content(system_prompt, contents, model, item, response_schema)
+            text_response = str(response.text)
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            print(f"LLM request failed ({e}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        try:
+            cache.put(key, model, text_response)
+        except OSError as e:
+            print(f"Error writing LLM cache: {e}")
+        return text_response
+
+
+def discard_cached(system_prompt: str, contents: str, model: str = GEMINI_MODEL,
+                   response_schema: Optional[dict] = None) -> None:
+    """ выкинуть ответ из кэша (например, если он оказался битым json) """
+    cache.discard(cache.key(model, cache_prompt(system_prompt, response_schema), contents))
+
+
+def parse_json_response(text_response: str):
+    edited_text_response = text_response.replace("```json", "").replace("```", "")
+    return json.loads(edited_text_response)
+
+
+def generate_many(
+    system_prompt: str,
+    items: Dict[str, str],
+    max_in_flight: int = LLM_MAX_IN_FLIGHT,
+) -> Iterator[Tuple[str, Union[str, Exception]]]:
+    """ Параллельно гоняет generate по items (id -> текст).
+    Отдает (id, ответ) по мере готовности; при ошибке вместо ответа - исключение. """
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        futures = {pool.submit(generate, system_prompt, text, item=item_id): item_id for item_id, text in items.items()}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from constants import LLM_CACHE_FOLDER, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class LLMCache:
+    """ Кэш ответов LLM на диске, ключ - (модель, хэш system prompt, хэш входа).
+    Запись атомарная (tmp + rename), так что несколько процессов могут писать одновременно.
+    Вытеснение: по TTL и по общему размеру (самые давно использованные - первыми). """
+
+    def __init__(self, folder: Path = LLM_CACHE_FOLDER, ttl: float = LLM_CACHE_TTL, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, system_prompt: str, contents: str) -> str:
+        return sha256(f"{model}\0{sha256(system_prompt)}\0{sha256(contents)}")
+
+    def _path(self, key: str) -> Path:
+        return self.folder / key[:2] / f"{key}.json"
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._count(hit=False)
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self.discard(key)
+            self._count(hit=False)
+            return None
+        # mtime = время последнего использования, по нему вытесняем при переполнении
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._count(hit=True)
+        return entry["response"]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"model": model, "created": time.time(), "response": response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def discard(self, key: str) -> None:
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> None:
+        if not self.folder.exists():
+            return
+        now = time.time()
+        entries = []
+        for path in self.folder.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            # mtime обновляется на каждом попадании, поэтому TTL проверяем по самой записи в get();
+            # здесь выкидываем то, что не трогали дольше TTL
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
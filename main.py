@@ -1,92 +1,262 @@
-import json
-from pathlib import Path
-import hashlib
-import time
+import argparse
 import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from itertools import chain, count
+from typing import Optional
 
 from constants import (
     RSS_LINKS, 
-    FILTER_BY_TITLE_AND_CONTENT_PROMPT,
     FILTER_BY_TEXT_PROMPT,
-    FEEDS_COUNT_AFTER_TITLE_AND_CONTENT_FILTER,
-    FEEDS_COUNT_CONFUSED,
-    API_KEY,
+    FILTER_BY_TITLE_AND_CONTENT_PROMPT,
+    BATCH_FILTER_BY_TEXT_PROMPT,
+    SECOND_FILTER_BATCH,
+    FIRST_FILTER_CHUNK_TOKENS,
+    PREFILTER_MIN_SCORE,
+    SNIPPET_FAST_PATH,
     ALERTS_FOLDER,
-    CONTENTS_FOLDER,
-    RESPONSES_1_FOLDER,
-    RESPONSES_2_FOLDER,
-    FINAL_FOLDER,
+    EXPORT_JSON,
+    TRACE_FOLDER,
+    FETCH_WORKERS,
+    FETCH_PER_HOST_CONCURRENCY,
+    FETCH_PER_HOST_DELAY,
+    PAGE_TEXT_TOKENS,
 )
 
-import feedparser
-import tiktoken
 import tqdm
-from google import genai
-from google.genai import types
-import trafilatura
-import justext
-from bs4 import BeautifulSoup
 from checkpoint import CheckpointManager, STAGES
-
-# safari selenium
-from selenium import webdriver
+from alert_store import AlertStore
+from dedup import cluster_alerts, alert_text
+from prefilter import KeywordMatcher, SnippetCheck
+from journal import RunJournal, FEED, PAGE, SUMMARY
+from ledger import Ledger, PREFILTERED, CANDIDATE, REJECTED_FIRST, REJECTED, APPROVED
+from rss import article_link, fetch_feeds, fetch_feeds_queued, request_feed
+from fetcher import ContentFetcher
+from extraction import Extractor
+from ratelimit import HostLimiter
+from llm import cached_context, generate, generate_many, cache as llm_cache
+from filters import (
+    count_tokens_per_item,
+    chunk_by_tokens,
+    run_first_filter,
+    parse_second_filter,
+    second_filter_batches,
+    iter_second_filter_batches,
+)
+from pipeline import StreamingPipeline, build_final_record
+from result_store import ResultStore, SECOND
+from token_accounting import accountant
+from tracing import tracer
+from workqueue import WorkQueue, FEED as FEED_JOB, FETCH as FETCH_JOB, SUMMARIZE as SUMMARIZE_JOB
+from distributed import Coordinator, QueueWorker
 
 # Initialize checkpoint manager
-checkpoint_mgr = CheckpointManager()
+checkpoint_mgr = CheckpointManager(tracer=tracer)
+alert_store = AlertStore()
+ledger = Ledger()
+results = ResultStore()
 
 
-def get_and_clean_html(driver: webdriver.Safari, link: str) -> str:
-    """ clean html here. if fallbacks:
-    trafilatura -> justext -> bs4 -> raw html"""
-    driver.get(link)
-    html = driver.page_source
-    # html = trafilatura.fetch_url(link)
-    
+def get_and_clean_html(fetcher: ContentFetcher, link: str, token_budget: Optional[int] = None) -> str:
+    """ текст страницы: HTTP с fallback на пул браузеров (см. fetcher.py) """
+    with tracer.span("get_and_clean_html", link):
+        return fetcher.fetch_text(link, token_budget)
+
+
+def fetch_link(fetcher: ContentFetcher, limiter: HostLimiter, link: str) -> str:
+    # алерты из файлов прошлых запусков могут хранить еще обернутую google.com/url ссылку
+    link = article_link(link)
+    with limiter(link):
+        # во второй фильтр идет только начало текста: чистка останавливается, набрав PAGE_TEXT_TOKENS
+        return get_and_clean_html(fetcher, link, PAGE_TEXT_TOKENS)
+
+
+def fetch_content(fetcher: ContentFetcher, limiter: HostLimiter, alert_id: str) -> str:
+    return fetch_link(fetcher, limiter, get_alert_by_id(alert_id)["link"])
+
+
+def fetch_many(fetcher: ContentFetcher, alert_ids: list):
+    """ (id, текст страницы) по мере готовности; при ошибке вместо текста - исключение """
+    limiter = HostLimiter(FETCH_PER_HOST_CONCURRENCY, FETCH_PER_HOST_DELAY)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        futures = {pool.submit(fetch_content, fetcher, limiter, alert_id): alert_id for alert_id in alert_ids}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def get_alert_by_id(alert_id) -> dict:
     try:
-        return str(trafilatura.extract(html, favor_recall=True))
-    except Exception as e:
-        print(f"Error cleaning html with trafilatura: {e}")
-    
+        return alert_store.get(alert_id)
+    except KeyError:
+        raise ValueError(f"Alert with id {alert_id} not found")
+
+
+def open_fetcher() -> ContentFetcher:
+    return ContentFetcher(extractor=Extractor())
+
+
+def close_fetcher(fetcher: ContentFetcher) -> None:
+    fetcher.close()
+    fetcher.extractor.close()
+
+
+def queue_handlers(fetcher: ContentFetcher) -> dict:
+    """ задания очереди (distributed.py): на входе только payload, общее состояние воркеру не нужно """
+    limiter = HostLimiter(FETCH_PER_HOST_CONCURRENCY, FETCH_PER_HOST_DELAY)
+    return {
+        FEED_JOB: lambda name, payload: vars(request_feed(name, payload["link"], payload["etag"], payload["modified"])),
+        FETCH_JOB: lambda alert_id, payload: fetch_link(fetcher, limiter, payload["link"]),
+        SUMMARIZE_JOB: lambda alert_id, payload: generate(FILTER_BY_TEXT_PROMPT, payload["content"], item=alert_id),
+    }
+
+
+def open_coordinator(run_id: str) -> Coordinator:
+    queue = WorkQueue()
+    queue.open_run(run_id)
+    # координатор сам тоже берет задания, так что запуск идет и без внешних воркеров
+    fetcher = open_fetcher()
+    worker = QueueWorker(queue, queue_handlers(fetcher), run_id=run_id, on_stop=partial(close_fetcher, fetcher)).start()
+    return Coordinator(queue, run_id, worker, on_rollup=lambda rollup: checkpoint_mgr.update_stats(workers=rollup))
+
+
+def run_worker(run_id: Optional[str] = None) -> None:
+    """ python main.py --worker [RUN_ID]: выполнять задания распределенного запуска """
+    fetcher = open_fetcher()
+    worker = QueueWorker(WorkQueue(), queue_handlers(fetcher), run_id=run_id, on_stop=partial(close_fetcher, fetcher))
+    worker.start()
+    print(f"Worker {worker.worker} serving {'run ' + run_id if run_id else 'latest open run'}")
     try:
-        return str(justext.justext(html, justext.get_stoplist("English")))
-    except Exception as e:
-        print(f"Error cleaning html with jusText: {e}")
-    
+        worker.wait()
+    finally:
+        worker.stop()
+        print(f"Worker done: {dict(worker.stats)}")
+
+
+def run_streaming(journal: RunJournal, chunks: list, prefilter_matches: dict, current_ids: list,
+                  alternate_links: dict, fetcher: Optional[ContentFetcher] = None,
+                  snippet_check: Optional[SnippetCheck] = None) -> None:
+    """ 2-5. без барьеров между стадиями: итог запуска в results растет по мере готовности алертов """
+    checkpoint_mgr.update_stats(
+        current_stage=STAGES["STREAMING"],
+        stage_progress=0.0,
+        stage_details=f"Streaming {len(chunks)} first filter chunks"
+    )
+    run_id = journal.run_id
+    records = []
+    # при --resume итог собирается заново (одобренное до падения придет из ledger)
+    results.set_final(run_id, [])
+
+    def on_record(record: dict) -> None:
+        records.append(record)
+        # дашборд видит запись сразу: WAL позволяет читать, пока мы пишем
+        results.add_final(run_id, [record])
+        checkpoint_mgr.update_stats(filtered_count=len(records))
+
+    # одобренные в прошлых запусках алерты, которые все еще есть в фидах, известны сразу
+    for alert_id in ledger.with_verdict(APPROVED, current_ids):
+        entry = ledger.get(alert_id)
+        on_record(build_final_record(
+            get_alert_by_id(alert_id), entry["title"], entry["summary"], alternate_links.get(alert_id, [])
+        ))
+
+    # fetcher снаружи (daemon.py) живет между запусками, свой - закрываем в конце
+    own_fetcher = fetcher is None
+    fetcher = fetcher or open_fetcher()
+    limiter = HostLimiter(FETCH_PER_HOST_CONCURRENCY, FETCH_PER_HOST_DELAY)
+    snippet_hits = count(1)
+
+    def fetch(alert_id: str) -> str:
+        text = snippet_check.text(get_alert_by_id(alert_id)) if snippet_check is not None else None
+        if text is not None:
+            checkpoint_mgr.update_stats(snippet_count=next(snippet_hits))
+            return text
+        return fetch_content(fetcher, limiter, alert_id)
+
+    pipeline = StreamingPipeline(fetch, alert_store, ledger, journal, checkpoint_mgr)
     try:
-        return str(BeautifulSoup(html, "html.parser").get_text())
-    except Exception as e:
-        print(f"Error cleaning html with bs4: {e}")
-    
-    return html
+        processed = pipeline.run(
+            chunks,
+            prefilter_matches,
+            pending_ids=ledger.with_verdict(CANDIDATE, current_ids),
+            on_record=on_record,
+            alternate_links=alternate_links,
+        )
+    finally:
+        if own_fetcher:
+            close_fetcher(fetcher)
 
+    # промежуточные результаты - в том же виде, что и в пакетном режиме
+    summaries = {
+        alert_id: {"title": item["title"], "summary": item["summary"]}
+        for alert_id, item in processed.items() if "summary" in item
+    }
+    results.add_first_filter(run_id, pipeline.first_filter, sent_ids=[item["id"] for chunk in chunks for item in chunk])
+    results.add_contents(run_id, {alert_id: item["content"] for alert_id, item in processed.items()})
+    record_second_filter_tokens({alert_id: item["content"] for alert_id, item in processed.items()})
+    results.add_summaries(run_id, summaries)
+    results.add_verdicts(run_id, SECOND, {
+        alert_id: ledger.verdict(alert_id)
+        for alert_id in processed if ledger.verdict(alert_id) in (APPROVED, REJECTED)
+    })
 
-def get_alert_by_id(alert_id) -> dict:
-    for feed_path in ALERTS_FOLDER.glob("*.json"):
-        alert = json.loads(feed_path.read_text())
-        for alert in alert:
-            if alert["id"] == alert_id:
-                return alert
-    raise ValueError(f"Alert with id {alert_id} not found")
+    print(f"LLM cache: {llm_cache.hits} hits, {llm_cache.misses} misses")
+    checkpoint_mgr.update_stats(
+        **accountant.stats(),
+        stage_progress=1.0,
+        stage_details="Processing complete",
+        filtered_count=len(records),
+        llm_cache_hits=llm_cache.hits,
+        llm_cache_misses=llm_cache.misses,
+    )
+
+
+def record_second_filter_tokens(contents: dict, batches: Optional[list] = None) -> dict:
+    """ batches=None - по запросу на статью """
+    if batches is None:
+        requests, system_prompt = len(contents), FILTER_BY_TEXT_PROMPT
+    else:
+        requests, system_prompt = len(batches), BATCH_FILTER_BY_TEXT_PROMPT
+    return accountant.record(
+        STAGES["SECOND_FILTER"], accountant.count(list(contents.values())),
+        requests=requests, system_prompt=system_prompt, cached_prompt=cached_context(system_prompt) is not None,
+    )
 
 
-def get_now_or_latest_file_in_folder(now: int, folder: Path) -> Path:
-    if (folder / f"{now}.json").exists():
-        return folder / f"{now}.json"
-    return max(folder.glob("*.json"), key=lambda x: x.stat().st_mtime)
+def finish_run(journal: RunJournal, coordinator: Optional[Coordinator] = None) -> None:
+    if coordinator is not None:
+        checkpoint_mgr.update_stats(workers=coordinator.close())
+    results.finish_run(journal.run_id)
+    if EXPORT_JSON:
+        results.export_json(journal.run_id)
+    llm_cache.evict()
+    accountant.save()
+    journal.close()
+    checkpoint_mgr.flush()
+    if tracer.record_events:
+        print(f"Trace: {tracer.export_chrome_trace(TRACE_FOLDER / f'{journal.run_id}.json')}")
 
 
-def main():
+def main(resume_run_id: Optional[str] = None, stream: bool = False, distributed: bool = False):
+    if resume_run_id:
+        # продолжаем тот же запуск: тот же журнал и тот же файл чекпоинта
+        checkpoint_mgr.current_run_id = resume_run_id
+    journal = RunJournal(checkpoint_mgr.current_run_id)
+    print(f"Run id: {journal.run_id} ({len(journal)} journaled items, resume with --resume {journal.run_id})")
+    
     checkpoint_mgr.update_stats(
         current_stage=STAGES["INIT"],
         stage_progress=0.0
     )
     
     now = int(datetime.datetime.now().timestamp())
+    run_id = journal.run_id
+    results.start_run(run_id, now)
     ALERTS_FOLDER.mkdir(exist_ok=True)
-    CONTENTS_FOLDER.mkdir(exist_ok=True)
-    RESPONSES_1_FOLDER.mkdir(exist_ok=True)
-    RESPONSES_2_FOLDER.mkdir(exist_ok=True)
-    FINAL_FOLDER.mkdir(exist_ok=True)
+    # фиды, страницы и суммаризация уходят заданиями в очередь, их разбирают все воркеры запуска
+    coordinator = open_coordinator(run_id) if distributed else None
 
     # 1. Проходим по всем алертам через RSS, собираем [title, link, content, published] и записываем в json
     # Получается 20 entry на каждый feed
@@ -98,36 +268,76 @@ def main():
     )
     
     total_feeds = len(RSS_LINKS)
-    for idx, (feed_name, feed_link) in enumerate(RSS_LINKS.items(), 1):
+    # фиды, скачанные до падения/остановки, повторно не качаем - берем с диска
+    pending_feeds = {}
+    for feed_name, feed_link in RSS_LINKS.items():
+        feed_path = (ALERTS_FOLDER / feed_name).with_suffix(".json")
+        if journal.done(FEED, feed_name) and feed_path.exists():
+            feed_alerts = alert_store.load_feed(feed_path)
+            results.add_alerts(run_id, feed_name, feed_alerts)
+            checkpoint_mgr.update_stats(total_alerts=checkpoint_mgr.stats.total_alerts + len(feed_alerts))
+            print(f"Feed '{feed_name}' already fetched in this run ({len(feed_alerts)} alerts)")
+        else:
+            pending_feeds[feed_name] = feed_link
+    
+    done_feeds = total_feeds - len(pending_feeds)
+    if coordinator is not None:
+        feed_results = fetch_feeds_queued(coordinator, pending_feeds, ALERTS_FOLDER)
+    else:
+        feed_results = fetch_feeds(pending_feeds, ALERTS_FOLDER)
+    fetched = set()
+    for idx, result in enumerate(feed_results, done_feeds + 1):
+        fetched.add(result.name)
         checkpoint_mgr.update_stats(
-            current_feed=feed_name,
+            current_feed=result.name,
             stage_progress=idx/total_feeds,
             stage_details=f"Processing feed {idx}/{total_feeds}"
         )
         
         # feed_path is json
-        feed_path = (ALERTS_FOLDER / feed_name).with_suffix(".json")
-        feed_alerts = []
-        feed = feedparser.parse(feed_link)
-        
-        # for each entry, gather title, link, content, published
-        for entry in feed.entries:
-            feed_alerts.append({
-                "id": hashlib.sha256(f"{entry.title}{entry.published}".encode()).hexdigest()[:8],
-                "title": entry.title,
-                "link": entry.link,
-                "content": entry.content,
-                "published": entry.published
-            })
-        feed_path.write_text(json.dumps(feed_alerts, indent=4))
+        feed_path = (ALERTS_FOLDER / result.name).with_suffix(".json")
+        if result.not_modified:
+            # 304: фид не менялся, файл с прошлого запуска остается как есть
+            feed_alerts = alert_store.load_feed(feed_path)
+            print(f"Feed '{result.name}' not modified ({len(feed_alerts)} alerts)")
+        else:
+            feed_alerts = result.alerts
+            alert_store.write_feed(feed_path, feed_alerts)
+            print(f"Feed '{result.name}' generated {len(feed_alerts)} alerts")
+        results.add_alerts(run_id, result.name, feed_alerts)
         
         checkpoint_mgr.update_stats(
             total_alerts=checkpoint_mgr.stats.total_alerts + len(feed_alerts)
         )
-        print(f"Feed '{feed_name}' generated {len(feed_alerts)} alerts")
-        time.sleep(1)
+        journal.record(FEED, result.name, {"alerts": len(feed_alerts)})
         
+    # фид не скачался: берем копию с прошлого запуска, чтобы его одобренные алерты не выпали из итога
+    for feed_name in pending_feeds.keys() - fetched:
+        feed_path = (ALERTS_FOLDER / feed_name).with_suffix(".json")
+        if feed_path.exists():
+            feed_alerts = alert_store.load_feed(feed_path)
+            results.add_alerts(run_id, feed_name, feed_alerts)
+            checkpoint_mgr.update_stats(total_alerts=checkpoint_mgr.stats.total_alerts + len(feed_alerts))
+            print(f"Feed '{feed_name}' failed, using the previous copy ({len(feed_alerts)} alerts)")
+    alert_store.save_index()
     print("All feeds generated\n----------------------")
+    process_alerts(journal, stream=stream, coordinator=coordinator)
+
+
+def process_alerts(journal: RunJournal, stream: bool = False, fetcher: Optional[ContentFetcher] = None,
+                   coordinator: Optional[Coordinator] = None) -> None:
+    """ 2-5. по всем алертам в alert_store: дедупликация, префильтр, фильтры LLM, итог запуска.
+    Классифицированные раньше (ledger) в LLM повторно не идут, поэтому daemon.py может звать
+    это после каждого опроса фидов - работа будет только по новым алертам. """
+    run_id = journal.run_id
+    # Одна и та же новость приходит из 5-10 изданий: склеиваем почти-дубликаты (MinHash по title+content)
+    # Дальше по пайплайну идет только представитель кластера, ссылки остальных попадут в итог
+    clusters = cluster_alerts(list(alert_store), preferred=ledger)
+    alternate_links = {
+        rep_id: [get_alert_by_id(alert_id)["link"] for alert_id in members[1:]]
+        for rep_id, members in clusters.items()
+    }
+    print(f"Deduplicated {len(alert_store)} alerts into {len(clusters)} clusters")
     
     # 2. Кидаем в LLM все связи title+content и позволяем ей отобрать релевантные для пользователя
     # Цель: получить FEEDS_COUNT_AFTER_TITLE_AND_CONTENT_FILTER+FEEDS_COUNT_CONFUSED релевантных алертов (id)
@@ -139,46 +349,78 @@ def main():
         stage_details="Preparing content for first filter"
     )
     
+    # дешевый локальный префильтр по ключевым словам из WHAT_IS_IMPORTANT: явно нерелевантное в LLM не шлем
+    matcher = KeywordMatcher()
+    snippet_check = SnippetCheck(matcher) if SNIPPET_FAST_PATH else None
+    prefilter_matches = {}
     payload = []
-    for feed_path in ALERTS_FOLDER.glob("*.json"):
-        alerts = json.loads(feed_path.read_text())
-        for alert in alerts:
-            payload.append({
-                "id": alert["id"],
-                "title": alert["title"],
-                "content": alert["content"][0]["value"],
-            })
+    for alert in alert_store:
+        # дубликаты и уже классифицированные в прошлых запусках алерты в LLM не шлем;
+        # отсеянные префильтром проверяем заново (дешево) - после правки ключевых слов они могут пройти
+        if alert["id"] not in clusters or ledger.verdict(alert["id"]) not in (None, PREFILTERED):
+            continue
+        # в ledger - и число ключевых слов, и группы WHAT_IS_IMPORTANT, к которым они относятся
+        score, groups = matcher.match(alert_text(alert))
+        prefilter_matches[alert["id"]] = {"prefilter_score": score, "prefilter_groups": groups}
+        if score < PREFILTER_MIN_SCORE:
+            ledger.record(alert["id"], PREFILTERED, **prefilter_matches[alert["id"]])
+            continue
+        payload.append({
+            "id": alert["id"],
+            "title": alert["title"],
+            "content": alert["content"][0]["value"],
+        })
+    # порядок alert_store зависит от того, в каком порядке докачались фиды (а при --resume - другой);
+    # куски и их ключи в журнале/LLM-кэше должны от этого не зависеть
+    payload.sort(key=lambda item: item["id"])
+
+    prefiltered_count = len(prefilter_matches) - len(payload)
+    print(f"Keyword prefilter dropped {prefiltered_count}/{len(prefilter_matches)} alerts")
+    checkpoint_mgr.update_stats(prefiltered_count=prefiltered_count)
     
-    token_count = tiktoken.encoding_for_model("gpt-4o").encode(json.dumps(payload))
-    total_tokens = len(token_count)
-    avg_tokens = total_tokens / len(payload)
+    # токены по каждому алерту (кэш по хэшу текста), они же - бюджет для нарезки на куски
+    token_counts = count_tokens_per_item(payload)
+    # payload может не влезть в контекст одним запросом - режем по токенам
+    chunks = chunk_by_tokens(payload, token_counts, FIRST_FILTER_CHUNK_TOKENS)
+    # кэш контекста с промптом создается здесь, один раз, а не первым из параллельных запросов
+    first_tokens = accountant.record(
+        STAGES["FIRST_FILTER"], token_counts, requests=len(chunks), system_prompt=FILTER_BY_TITLE_AND_CONTENT_PROMPT,
+        cached_prompt=cached_context(FILTER_BY_TITLE_AND_CONTENT_PROMPT) is not None,
+    )
     
     checkpoint_mgr.update_stats(
-        tokens_processed=total_tokens,
-        avg_tokens_per_item=avg_tokens,
+        **accountant.stats(),
         stage_progress=0.3,
-        stage_details="Content prepared, starting AI filtering"
+        stage_details=f"Content prepared, starting AI filtering ({len(chunks)} chunks)"
     )
     
-    print(f"Tokens (pre-filter): total {total_tokens}, average {avg_tokens}")
+    print(f"Tokens (pre-filter): total {first_tokens['total']}, average {first_tokens['mean']}, "
+          f"p95 {first_tokens['p95']}, chunks {len(chunks)}, ~${first_tokens['cost_usd']}")
+    
+    if stream:
+        run_streaming(journal, chunks, prefilter_matches, list(clusters), alternate_links, fetcher, snippet_check)
+        finish_run(journal, coordinator)
+        return
 
-    client = genai.Client(api_key=API_KEY, http_options={"base_url": "https://api.proxyapi.ru/google"})
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=json.dumps(payload),
-        config=types.GenerateContentConfig(system_instruction=FILTER_BY_TITLE_AND_CONTENT_PROMPT),
-    )
-    text_response = str(response.text)
-    edited_text_response = text_response.replace("```json", "").replace("```", "")
-    json_response = json.loads(edited_text_response)
+    json_response = run_first_filter(chunks, journal)
+    picked_ids = set(json_response["relevant_ids"] + json_response["unsure_ids"])
+    for item in payload:
+        ledger.record(
+            item["id"],
+            CANDIDATE if item["id"] in picked_ids else REJECTED_FIRST,
+            **prefilter_matches[item["id"]],
+        )
+    ledger.save()
     
     checkpoint_mgr.update_stats(
         stage_progress=1.0,
         filtered_count=len(json_response.get("relevant_ids", [])) + len(json_response.get("unsure_ids", [])),
+        llm_cache_hits=llm_cache.hits,
+        llm_cache_misses=llm_cache.misses,
         stage_details="First filter complete"
     )
     
-    (RESPONSES_1_FOLDER / f"{now}.json").write_text(json.dumps(json_response, indent=4))
+    results.add_first_filter(run_id, json_response, sent_ids=[item["id"] for item in payload])
     
     # 3. По предварительно аппрувнутым от LLM алертам проходим по ссылкам, чистим content (jusText/trafilatura/etc.)
     # Почищенные html записываем в json (папка contents)
@@ -192,37 +434,59 @@ def main():
         stage_details="Starting content fetch"
     )
     
-    # open 'now' if exist else latest
-    with open(get_now_or_latest_file_in_folder(now, RESPONSES_1_FOLDER), "r") as f:
-        json_response = json.load(f)
     # пока просто суммируем их (я хз, зачем я решил добавить unsure_ids)
     filtered_ids = json_response["relevant_ids"] + json_response["unsure_ids"]
+    # кандидаты прошлых запусков, которые не дошли до второго фильтра (упал fetch или LLM)
+    current_ids = list(clusters)
+    filtered_ids += [
+        alert_id for alert_id in ledger.with_verdict(CANDIDATE, current_ids) if alert_id not in filtered_ids
+    ]
+    print(f"New alerts: {len(payload)}, sent to content fetch: {len(filtered_ids)}")
 
-    contents = {}
+    # страницы, скачанные до падения, берем из журнала
+    contents = {alert_id: journal.get(PAGE, alert_id) for alert_id in filtered_ids if journal.done(PAGE, alert_id)}
+    # алертам, у которых сниппет из фида достаточно содержательный, страница не нужна
+    if snippet_check is not None:
+        snippets = {
+            alert_id: snippet_check.text(get_alert_by_id(alert_id))
+            for alert_id in filtered_ids if alert_id not in contents
+        }
+        snippets = {alert_id: text for alert_id, text in snippets.items() if text is not None}
+        contents.update(snippets)
+        checkpoint_mgr.update_stats(snippet_count=len(snippets))
+        print(f"RSS snippet is enough for {len(snippets)}/{len(filtered_ids)} alerts")
+    pending_ids = [alert_id for alert_id in filtered_ids if alert_id not in contents]
     error_count = 0
-    for idx, alert_id in enumerate(filtered_ids, 1):
-        try:
-            alert = get_alert_by_id(alert_id)
-            checkpoint_mgr.update_stats(
-                stage_progress=idx/len(filtered_ids),
-                stage_details=f"Fetching content {idx}/{len(filtered_ids)}: {alert['title'][:50]}..."
-            )
-            
-            driver = webdriver.Safari()
-            content = get_and_clean_html(driver, alert["link"])[:1000]
-            driver.quit()
-            contents[alert_id] = content
-        except Exception as e:
-            print(f"Error fetching content for alert {alert_id}: {e}")
+    own_fetcher = fetcher is None and coordinator is None
+    if coordinator is not None:
+        fetched = coordinator.map(FETCH_JOB, {
+            alert_id: {"link": get_alert_by_id(alert_id)["link"]} for alert_id in pending_ids
+        })
+    else:
+        fetcher = fetcher or open_fetcher()
+        fetched = fetch_many(fetcher, pending_ids)
+    for idx, (alert_id, content) in enumerate(fetched, len(contents) + 1):
+        checkpoint_mgr.update_stats(
+            stage_progress=idx/len(filtered_ids),
+            stage_details=f"Fetched content {idx}/{len(filtered_ids)}"
+        )
+        if isinstance(content, Exception):
+            print(f"Error fetching content for alert {alert_id}: {content}")
             error_count += 1
             checkpoint_mgr.update_stats(error_count=error_count)
             continue
+        contents[alert_id] = content
+        journal.record(PAGE, alert_id, content)
+    if own_fetcher:
+        close_fetcher(fetcher)
+    # порядок как в ответе первого фильтра, а не как успели скачаться
+    contents = {alert_id: contents[alert_id] for alert_id in filtered_ids if alert_id in contents}
             
     checkpoint_mgr.update_stats(
         stage_progress=1.0,
         stage_details="Content fetch complete"
     )
-    (CONTENTS_FOLDER / f"{now}.json").write_text(json.dumps(contents, indent=4))
+    results.add_contents(run_id, contents)
     
     checkpoint_mgr.update_stats(
         current_stage=STAGES["SECOND_FILTER"],
@@ -230,50 +494,62 @@ def main():
         stage_details="Starting second filter"
     )
     
-    with open(get_now_or_latest_file_in_folder(now, CONTENTS_FOLDER), "r") as f:
-        json_contents = json.load(f)
+    json_contents = contents
     
-    # count sent tokens
-    token_count = tiktoken.encoding_for_model("gpt-4o").encode(json.dumps(json_contents))
-    total_tokens = len(token_count)
-    avg_tokens = total_tokens / len(json_contents)
+    summaries = {}
+    error_count = checkpoint_mgr.stats.error_count
+    # ответы, полученные до падения, берем из журнала (уже разобранный json)
+    journaled = {
+        alert_id: journal.get(SUMMARY, alert_id) for alert_id in json_contents if journal.done(SUMMARY, alert_id)
+    }
+    to_send = {alert_id: text for alert_id, text in json_contents.items() if alert_id not in journaled}
+    if coordinator is not None:
+        batches = None
+        generated = parse_second_filter(
+            coordinator.map(SUMMARIZE_JOB, {alert_id: {"content": text} for alert_id, text in to_send.items()}),
+            to_send,
+        )
+    elif SECOND_FILTER_BATCH:
+        # несколько статей за запрос: system prompt и накладные расходы запроса делятся на батч
+        batches = second_filter_batches(to_send)
+        generated = iter_second_filter_batches(batches)
+    else:
+        batches = None
+        generated = parse_second_filter(generate_many(FILTER_BY_TEXT_PROMPT, to_send), to_send)
+    second_tokens = record_second_filter_tokens(json_contents, batches)
     
     checkpoint_mgr.update_stats(
-        tokens_processed=checkpoint_mgr.stats.tokens_processed + total_tokens,
-        avg_tokens_per_item=(checkpoint_mgr.stats.avg_tokens_per_item + avg_tokens) / 2,
+        **accountant.stats(),
         stage_progress=0.2,
         stage_details="Content prepared for second filter"
     )
     
-    print(f"Tokens (main filter): total {total_tokens}, average {avg_tokens}")
+    print(f"Tokens (main filter): total {second_tokens['total']}, average {second_tokens['mean']}, "
+          f"p95 {second_tokens['p95']}, {second_tokens['requests']} requests, ~${second_tokens['cost_usd']}")
     
-    summaries = {}
-    error_count = checkpoint_mgr.stats.error_count
-    for idx, (alert_id, alert_text) in enumerate(json_contents.items(), 1):
+    responses = chain(journaled.items(), generated)
+    for idx, (alert_id, json_response) in enumerate(responses, 1):
         checkpoint_mgr.update_stats(
             stage_progress=0.2 + 0.8 * (idx/len(json_contents)),
-            stage_details=f"Processing alert {idx}/{len(json_contents)}"
+            stage_details=f"Processed alert {idx}/{len(json_contents)}"
         )
         
         try:
-            client = genai.Client(api_key=API_KEY, http_options={"base_url": "https://api.proxyapi.ru/google"})
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=alert_text,
-                config=types.GenerateContentConfig(system_instruction=FILTER_BY_TEXT_PROMPT),
-            )
-            text_response = str(response.text)
-            edited_text_response = text_response.replace("```json", "").replace("```", "")
-            json_response = json.loads(edited_text_response)
+            if isinstance(json_response, Exception):
+                raise json_response
+            if alert_id not in journaled:
+                journal.record(SUMMARY, alert_id, json_response)
             if not json_response:
+                ledger.record(alert_id, REJECTED)
                 continue
             title, summary = json_response["title"], json_response["summary"]
             summaries[alert_id] = {
                 "title": title,
                 "summary": summary
             }
-        except Exception:
-            print(f"Error parsing json (alert {alert_id}). Text: {text_response}")
+            ledger.record(alert_id, APPROVED, title=title, summary=summary)
+        except Exception as e:
+            print(f"Error parsing json (alert {alert_id}): {e}")
             error_count += 1
             checkpoint_mgr.update_stats(error_count=error_count)
             continue
@@ -281,7 +557,21 @@ def main():
         checkpoint_mgr.update_stats(
             filtered_count=len(summaries)
         )
-        (RESPONSES_2_FOLDER / f"{now}.json").write_text(json.dumps(summaries, indent=4, ensure_ascii=False))
+    
+    checkpoint_mgr.update_stats(
+        llm_cache_hits=llm_cache.hits,
+        llm_cache_misses=llm_cache.misses,
+    )
+    print(f"LLM cache: {llm_cache.hits} hits, {llm_cache.misses} misses")
+    ledger.save()
+    
+    # пишем один раз на весь батч, порядок - как в contents
+    summaries = {alert_id: summaries[alert_id] for alert_id in json_contents if alert_id in summaries}
+    results.add_summaries(run_id, summaries)
+    results.add_verdicts(run_id, SECOND, {
+        alert_id: ledger.verdict(alert_id)
+        for alert_id in json_contents if ledger.verdict(alert_id) in (APPROVED, REJECTED)
+    })
     
     # 5. К id+summary от LLM добавляем link, title и published (обогащаем json)
 
@@ -291,8 +581,12 @@ def main():
         stage_details="Starting final processing"
     )
     
-    with open(get_now_or_latest_file_in_folder(now, RESPONSES_2_FOLDER), "r") as f:
-        json_responses = json.load(f)
+    json_responses = dict(summaries)
+    # одобренные в прошлых запусках алерты, которые все еще есть в фидах, переносим в итог
+    for alert_id in ledger.with_verdict(APPROVED, current_ids):
+        if alert_id not in json_responses:
+            entry = ledger.get(alert_id)
+            json_responses[alert_id] = {"title": entry["title"], "summary": entry["summary"]}
     new_json = []
     
     for idx, (alert_id, text) in enumerate(json_responses.items(), 1):
@@ -301,15 +595,9 @@ def main():
             stage_details=f"Finalizing alert {idx}/{len(json_responses)}"
         )
         
-        title, summary = text["title"], text["summary"]
-        alert = get_alert_by_id(alert_id)
-        new_json.append({
-            "id": alert_id,
-            "link": alert["link"],
-            "title": title,
-            "published": alert["published"],
-            "summary": summary
-        })
+        new_json.append(build_final_record(
+            get_alert_by_id(alert_id), text["title"], text["summary"], alternate_links.get(alert_id, [])
+        ))
     
     checkpoint_mgr.update_stats(
         stage_progress=1.0,
@@ -317,8 +605,24 @@ def main():
         filtered_count=len(new_json)
     )
     
-    (FINAL_FOLDER / f"{now}.json").write_text(json.dumps(new_json, indent=4, ensure_ascii=False))
+    results.set_final(run_id, new_json)
+    finish_run(journal, coordinator)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", metavar="RUN_ID", help="продолжить упавший/остановленный запуск по его журналу")
+    parser.add_argument("--stream", action="store_true", help="стадии 2-5 потоком, без ожидания конца предыдущей стадии")
+    parser.add_argument("--trace", action="store_true", help="записать chrome-trace запуска в .traces/<run_id>.json")
+    parser.add_argument("--distributed", action="store_true",
+                        help="раздавать фиды, страницы и суммаризацию через очередь (QUEUE_DB_PATH) воркерам --worker")
+    parser.add_argument("--worker", nargs="?", const="", metavar="RUN_ID",
+                        help="только выполнять задания распределенного запуска (по умолчанию - последнего открытого)")
+    args = parser.parse_args()
+    if args.distributed and args.stream:
+        parser.error("--distributed works with staged mode only")
+    tracer.record_events = args.trace
+    if args.worker is not None:
+        run_worker(args.worker or None)
+    else:
+        main(resume_run_id=args.resume, stream=args.stream, distributed=args.distributed)
\ No newline at end of file
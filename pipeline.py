@@ -0,0 +1,219 @@
+import queue
+import threading
+from typing import Callable, Dict, List, Optional
+
+from constants import (
+    FILTER_BY_TEXT_PROMPT,
+    FEEDS_COUNT_AFTER_TITLE_AND_CONTENT_FILTER,
+    FEEDS_COUNT_CONFUSED,
+    FETCH_WORKERS,
+    LLM_MAX_IN_FLIGHT,
+    STREAM_QUEUE_SIZE,
+)
+from checkpoint import CheckpointManager
+from alert_store import AlertStore
+from journal import RunJournal, PAGE, SUMMARY
+from ledger import Ledger, CANDIDATE, REJECTED_FIRST, REJECTED, APPROVED
+from llm import generate, parse_json_response, discard_cached
+from filters import iter_first_filter
+
+_DONE = object()
+
+
+def build_final_record(alert: dict, title: str, summary: str, alternate_links: List[str]) -> dict:
+    """ 5. К id+summary от LLM добавляем link, title и published """
+    return {
+        "id": alert["id"],
+        "link": alert["link"],
+        "title": title,
+        "published": alert["published"],
+        "summary": summary,
+        "alternate_links": alternate_links,
+    }
+
+
+class StreamingPipeline:
+    """ Стадии 2-5 без барьеров: связаны ограниченными очередями.
+
+    first filter (куски по мере ответа LLM) -> fetch_queue -> fetch-воркеры
+        -> summarize_queue -> summarize-воркеры -> results -> вызывающий поток (ledger, итоговые записи)
+
+    Одобренный первым фильтром id сразу уходит на скачивание, почищенная страница - сразу в LLM,
+    итоговая запись отдается в on_record, как только готова. Ограниченные очереди дают backpressure:
+    если LLM не успевает, фетчеры ждут, а не копят страницы в памяти. """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], str],
+        alert_store: AlertStore,
+        ledger: Ledger,
+        journal: RunJournal,
+        checkpoint_mgr: CheckpointManager,
+        fetch_workers: int = FETCH_WORKERS,
+        summarize_workers: int = LLM_MAX_IN_FLIGHT,
+        queue_size: int = STREAM_QUEUE_SIZE,
+    ):
+        self.fetch = fetch
+        self.alert_store = alert_store
+        self.ledger = ledger
+        self.journal = journal
+        self.checkpoint_mgr = checkpoint_mgr
+        self.fetch_workers = fetch_workers
+        self.summarize_workers = summarize_workers
+        self.fetch_queue = queue.Queue(maxsize=queue_size)
+        self.summarize_queue = queue.Queue(maxsize=queue_size)
+        # результаты не ограничиваем: их разбирает вызывающий поток, он не должен блокировать воркеров
+        self.results = queue.Queue()
+        self.producer_error: Optional[Exception] = None
+        # итог первого фильтра в формате RESPONSES_1 (с учетом лимитов)
+        self.first_filter = {"relevant_ids": [], "unsure_ids": []}
+        self.queued = 0
+
+    # --- producer: первый фильтр ---
+
+    def _produce(self, chunks: List[List[dict]], prefilter_matches: Dict[str, dict], pending_ids: List[str]) -> None:
+        seen = set()
+
+        def enqueue(alert_id: str) -> None:
+            if alert_id not in seen:
+                seen.add(alert_id)
+                self.queued += 1
+                self.fetch_queue.put(alert_id)
+
+        try:
+            # кандидаты прошлых запусков известны сразу
+            for alert_id in pending_ids:
+                enqueue(alert_id)
+
+            # глобальные лимиты первого фильтра: берем id в порядке прихода ответов
+            budgets = {"relevant_ids": FEEDS_COUNT_AFTER_TITLE_AND_CONTENT_FILTER, "unsure_ids": FEEDS_COUNT_CONFUSED}
+            for idx, response in iter_first_filter(chunks, self.journal):
+                picked = set()
+                for key in budgets:
+                    for alert_id in response.get(key, []):
+                        if budgets[key] > 0 and alert_id not in seen:
+                            budgets[key] -= 1
+                            picked.add(alert_id)
+                            self.first_filter[key].append(alert_id)
+                            enqueue(alert_id)
+                for item in chunks[idx]:
+                    self.ledger.record(
+                        item["id"],
+                        CANDIDATE if item["id"] in picked else REJECTED_FIRST,
+                        **prefilter_matches.get(item["id"], {}),
+                    )
+                self.ledger.save()
+        except Exception as e:
+            self.producer_error = e
+
+    # --- воркеры ---
+
+    def _fetch_loop(self) -> None:
+        while True:
+            alert_id = self.fetch_queue.get()
+            if alert_id is _DONE:
+                return
+            try:
+                if self.journal.done(PAGE, alert_id):
+                    content = self.journal.get(PAGE, alert_id)
+                else:
+                    content = self.fetch(alert_id)
+                    self.journal.record(PAGE, alert_id, content)
+            except Exception as e:
+                self.results.put((alert_id, None, e))
+                continue
+            self.summarize_queue.put((alert_id, content))
+
+    def _summarize_loop(self) -> None:
+        while True:
+            item = self.summarize_queue.get()
+            if item is _DONE:
+                return
+            alert_id, content = item
+            text_response = None
+            try:
+                if self.journal.done(SUMMARY, alert_id):
+                    json_response = self.journal.get(SUMMARY, alert_id)
+                else:
+                    text_response = generate(FILTER_BY_TEXT_PROMPT, content, item=alert_id)
+                    json_response = parse_json_response(text_response)
+                    self.journal.record(SUMMARY, alert_id, json_response)
+                self.results.put((alert_id, content, json_response))
+            except Exception as e:
+                if text_response is not None:
+                    discard_cached(FILTER_BY_TEXT_PROMPT, content)
+                self.results.put((alert_id, content, e))
+
+    def _coordinate(self, producer: threading.Thread, fetchers: list, summarizers: list) -> None:
+        """ закрывает очереди по цепочке, когда предыдущая стадия закончила """
+        producer.join()
+        for _ in fetchers:
+            self.fetch_queue.put(_DONE)
+        for thread in fetchers:
+            thread.join()
+        for _ in summarizers:
+            self.summarize_queue.put(_DONE)
+        for thread in summarizers:
+            thread.join()
+        self.results.put(_DONE)
+
+    def _start(self, target, count: int, name: str, *args) -> list:
+        threads = [threading.Thread(target=target, args=args, name=f"{name}-{i}", daemon=True) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def run(
+        self,
+        chunks: List[List[dict]],
+        prefilter_matches: Dict[str, dict],
+        pending_ids: List[str],
+        on_record: Callable[[dict], None],
+        alternate_links: Dict[str, List[str]],
+    ) -> Dict[str, dict]:
+        """ гонит пайплайн до конца; возвращает {id: {"content", "title", "summary"}} по обработанным алертам """
+        producer = self._start(self._produce, 1, "first-filter", chunks, prefilter_matches, pending_ids)[0]
+        fetchers = self._start(self._fetch_loop, self.fetch_workers, "fetch")
+        summarizers = self._start(self._summarize_loop, self.summarize_workers, "summarize")
+        self._start(self._coordinate, 1, "coordinator", producer, fetchers, summarizers)
+
+        processed = {}
+        error_count = self.checkpoint_mgr.stats.error_count
+        done = 0
+        while True:
+            item = self.results.get()
+            if item is _DONE:
+                break
+            alert_id, content, result = item
+            done += 1
+            self.checkpoint_mgr.update_stats(
+                stage_progress=done / max(self.queued, 1),
+                stage_details=f"Streamed {done}/{self.queued} alerts (fetch queue {self.fetch_queue.qsize()}, "
+                              f"summarize queue {self.summarize_queue.qsize()})"
+            )
+            if isinstance(result, Exception):
+                stage = "fetching content" if content is None else "summarizing"
+                print(f"Error {stage} for alert {alert_id}: {result}")
+                error_count += 1
+                self.checkpoint_mgr.update_stats(error_count=error_count)
+                continue
+
+            processed[alert_id] = {"content": content}
+            if not result:
+                self.ledger.record(alert_id, REJECTED)
+                continue
+            try:
+                title, summary = result["title"], result["summary"]
+            except (KeyError, TypeError) as e:
+                print(f"Error parsing json (alert {alert_id}): {e}. Response: {result}")
+                error_count += 1
+                self.checkpoint_mgr.update_stats(error_count=error_count)
+                continue
+            processed[alert_id].update(title=title, summary=summary)
+            self.ledger.record(alert_id, APPROVED, title=title, summary=summary)
+            on_record(build_final_record(self.alert_store.get(alert_id), title, summary, alternate_links.get(alert_id, [])))
+
+        self.ledger.save()
+        if self.producer_error is not None:
+            raise self.producer_error
+        return processed
@@ -0,0 +1,116 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from constants import (
+    WHAT_IS_IMPORTANT,
+    SNIPPET_MIN_CHARS,
+    SNIPPET_MIN_TOKENS,
+    SNIPPET_MIN_KEYWORD_DENSITY,
+)
+from dedup import alert_text
+from token_accounting import accountant
+
+CATEGORY_RE = re.compile(r"^\s*(\d+)\.\s+(.+)$")
+BULLET_RE = re.compile(r"^\s*•\s*[^:]+:\s*(.+)$")
+
+
+def parse_keyword_groups(text: str = WHAT_IS_IMPORTANT) -> Dict[str, List[str]]:
+    """ '1. Заголовок' + строки '• Label: kw, kw, ...' -> {заголовок категории: [keywords]} """
+    groups = defaultdict(list)
+    category = None
+    for line in text.splitlines():
+        category_match = CATEGORY_RE.match(line)
+        if category_match:
+            category = category_match.group(2).strip()
+            continue
+        bullet_match = BULLET_RE.match(line)
+        if bullet_match and category:
+            for keyword in bullet_match.group(1).split(","):
+                keyword = keyword.strip().rstrip(".").lower()
+                if keyword and keyword not in groups[category]:
+                    groups[category].append(keyword)
+    return dict(groups)
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """ альтернатива в виде префиксного дерева: движок re не перебирает сотни веток на каждой позиции """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if end else body
+
+    return emit(trie)
+
+
+class KeywordMatcher:
+    """ Скомпилированный мульти-паттерн по ключевым словам из WHAT_IS_IMPORTANT.
+    score - сколько разных ключевых слов нашлось в тексте, плюс категории, к которым они относятся. """
+
+    def __init__(self, groups: Dict[str, List[str]] = None):
+        self.groups = groups if groups is not None else parse_keyword_groups()
+        self.keyword_groups = defaultdict(set)
+        for category, keywords in self.groups.items():
+            for keyword in keywords:
+                self.keyword_groups[keyword].add(category)
+        # Текст заранее приводим к lower (re.IGNORECASE в ~3 раза медленнее) и ищем совпадения,
+        # начинающиеся с не-буквенного символа: у паттерна появляется стартовый charset,
+        # и re быстро пропускает позиции внутри слов, вместо того чтобы проверять \b на каждой.
+        # Ключевые слова в тексте бывают и во множественном числе ("lawsuits", "policies"): окончание
+        # s/es допускаем после любого слова, а у слов на -y добавляем форму на -ies (вариант -> само слово)
+        self.variants = {keyword: keyword for keyword in self.keyword_groups}
+        for keyword in self.keyword_groups:
+            if keyword.endswith("y") and len(keyword) > 2:
+                self.variants.setdefault(keyword[:-1] + "ies", keyword)
+        pattern = _trie_pattern(list(self.variants))
+        self.regex = re.compile(r"\W(" + pattern + r")(?:s|es)?\b")
+
+    def keywords(self, text: str) -> set:
+        return {self.variants[variant] for variant in self.regex.findall(" " + text.lower())}
+
+    def hits(self, text: str) -> int:
+        """ все вхождения ключевых слов, с повторами """
+        return len(self.regex.findall(" " + text.lower()))
+
+    def match(self, text: str) -> Tuple[int, List[str]]:
+        """ (score, категории, в которых что-то нашлось) """
+        keywords = self.keywords(text)
+        categories = set()
+        for keyword in keywords:
+            categories |= self.keyword_groups[keyword]
+        return len(keywords), sorted(categories)
+
+
+class SnippetCheck:
+    """ Хватит ли второму фильтру сниппета из фида вместо полной страницы.
+    Со страницы все равно берется только начало текста, так что длинный сниппет, плотный
+    по ключевым словам, дает модели почти то же самое - без загрузки страницы. """
+
+    def __init__(self, matcher: KeywordMatcher, min_chars: int = SNIPPET_MIN_CHARS,
+                 min_tokens: int = SNIPPET_MIN_TOKENS, min_density: float = SNIPPET_MIN_KEYWORD_DENSITY):
+        self.matcher = matcher
+        self.min_chars = min_chars
+        self.min_tokens = min_tokens
+        self.min_density = min_density
+
+    def text(self, alert: dict) -> Optional[str]:
+        """ очищенные title + сниппет, если их достаточно, иначе None - страницу надо качать """
+        text = " ".join(alert_text(alert).split())
+        if len(text) < self.min_chars:
+            return None
+        words = len(text.split())
+        if self.matcher.hits(text) / max(words, 1) < self.min_density:
+            return None
+        if accountant.count([text])[0] < self.min_tokens:
+            return None
+        return text
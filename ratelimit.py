@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+
+def host_of(link: str) -> str:
+    return urlparse(link).netloc.lower()
+
+
+class HostLimiter:
+    """ per-host politeness: не больше max_concurrency запросов одновременно
+    на один хост и не чаще, чем раз в min_interval секунд """
+
+    def __init__(self, max_concurrency: int = 1, min_interval: float = 0.0):
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = defaultdict(lambda: threading.Semaphore(self.max_concurrency))
+        self._next_slot = defaultdict(float)
+
+    def _semaphore(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            return self._semaphores[host]
+
+    def _wait_for_slot(self, host: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot[host])
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def acquire(self, link: str) -> str:
+        host = host_of(link)
+        self._semaphore(host).acquire()
+        self._wait_for_slot(host)
+        return host
+
+    def release(self, host: str) -> None:
+        self._semaphore(host).release()
+
+    def __call__(self, link: str):
+        return _HostSlot(self, link)
+
+
+class _HostSlot:
+    def __init__(self, limiter: HostLimiter, link: str):
+        self.limiter = limiter
+        self.link = link
+        self.host = ""
+
+    def __enter__(self):
+        self.host = self.limiter.acquire(self.link)
+        return self.host
+
+    def __exit__(self, *exc):
+        self.limiter.release(self.host)
+        return False
+
+
+class TokenBucket:
+    """ token bucket: в среднем rate запросов в секунду, всплеском до capacity """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,304 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from constants import (
+    RESULTS_DB_PATH,
+    CONTENTS_FOLDER,
+    RESPONSES_1_FOLDER,
+    RESPONSES_2_FOLDER,
+    FINAL_FOLDER,
+)
+from tracing import tracer
+
+# стадии в таблице verdicts
+FIRST = "first"  # relevant / unsure / rejected
+SECOND = "second"  # approved / rejected
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started INTEGER NOT NULL,  -- unix ts, он же имя json-файлов при экспорте
+    finished INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_by_started ON runs (started);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    run_id TEXT NOT NULL,
+    alert_id TEXT NOT NULL,
+    feed TEXT NOT NULL,
+    title TEXT,
+    link TEXT,
+    published TEXT,
+    data TEXT NOT NULL,  -- алерт целиком (json)
+    PRIMARY KEY (run_id, alert_id)
+);
+CREATE INDEX IF NOT EXISTS alerts_by_id ON alerts (alert_id);
+
+CREATE TABLE IF NOT EXISTS contents (
+    run_id TEXT NOT NULL,
+    alert_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (run_id, alert_id)
+);
+
+CREATE TABLE IF NOT EXISTS verdicts (
+    run_id TEXT NOT NULL,
+    alert_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    verdict TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (run_id, stage, alert_id)
+);
+CREATE INDEX IF NOT EXISTS verdicts_by_id ON verdicts (alert_id);
+
+CREATE TABLE IF NOT EXISTS summaries (
+    run_id TEXT NOT NULL,
+    alert_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (run_id, alert_id)
+);
+CREATE INDEX IF NOT EXISTS summaries_by_id ON summaries (alert_id);
+
+CREATE TABLE IF NOT EXISTS final (
+    run_id TEXT NOT NULL,
+    alert_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    record TEXT NOT NULL,  -- итоговая запись (json), как в FINAL_FOLDER
+    PRIMARY KEY (run_id, alert_id)
+);
+"""
+
+
+class ResultStore:
+    """ Результаты всех запусков в одной SQLite-базе (WAL: дашборд читает, пока main.py пишет).
+    Все таблицы ключуются (run_id, alert_id), так что "последний запуск", поиск алерта
+    и история по нему - индексные чтения, а не glob + парсинг json-файлов. """
+
+    def __init__(self, path: Path = RESULTS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def _write(self, sql: str, rows: Iterable[tuple]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    def _read(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- запись ---
+
+    def start_run(self, run_id: str, started: int) -> None:
+        """ при --resume запуск уже есть: started остается от первого старта """
+        self._write("INSERT OR IGNORE INTO runs (run_id, started) VALUES (?, ?)", [(run_id, started)])
+
+    def finish_run(self, run_id: str) -> None:
+        self._write("UPDATE runs SET finished = ? WHERE run_id = ?", [(int(time.time()), run_id)])
+
+    def add_alerts(self, run_id: str, feed: str, alerts: List[dict]) -> None:
+        self._write(
+            "INSERT OR REPLACE INTO alerts (run_id, alert_id, feed, title, link, published, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (run_id, alert["id"], feed, alert["title"], alert["link"], alert["published"],
+                 json.dumps(alert, ensure_ascii=False))
+                for alert in alerts
+            ],
+        )
+
+    def add_first_filter(self, run_id: str, response: Dict[str, List[str]], sent_ids: Iterable[str]) -> None:
+        """ ответ первого фильтра; все отправленные, но не выбранные id - rejected """
+        verdicts = {}
+        for key, verdict in (("relevant_ids", "relevant"), ("unsure_ids", "unsure")):
+            for alert_id in response.get(key, []):
+                verdicts.setdefault(alert_id, verdict)
+        for alert_id in sent_ids:
+            verdicts.setdefault(alert_id, "rejected")
+        self.add_verdicts(run_id, FIRST, verdicts)
+
+    def add_verdicts(self, run_id: str, stage: str, verdicts: Dict[str, str]) -> None:
+        start = self._next_position("verdicts", run_id, "AND stage = ?", (stage,))
+        self._write(
+            "INSERT OR REPLACE INTO verdicts (run_id, alert_id, stage, verdict, position) VALUES (?, ?, ?, ?, ?)",
+            [(run_id, alert_id, stage, verdict, pos) for pos, (alert_id, verdict) in enumerate(verdicts.items(), start)],
+        )
+
+    def add_contents(self, run_id: str, contents: Dict[str, str]) -> None:
+        start = self._next_position("contents", run_id)
+        self._write(
+            "INSERT OR REPLACE INTO contents (run_id, alert_id, position, content) VALUES (?, ?, ?, ?)",
+            [(run_id, alert_id, pos, content) for pos, (alert_id, content) in enumerate(contents.items(), start)],
+        )
+
+    def add_summaries(self, run_id: str, summaries: Dict[str, dict]) -> None:
+        start = self._next_position("summaries", run_id)
+        self._write(
+            "INSERT OR REPLACE INTO summaries (run_id, alert_id, position, title, summary) VALUES (?, ?, ?, ?, ?)",
+            [
+                (run_id, alert_id, pos, item["title"], item["summary"])
+                for pos, (alert_id, item) in enumerate(summaries.items(), start)
+            ],
+        )
+
+    def add_final(self, run_id: str, records: List[dict]) -> None:
+        """ дописывает записи в итог запуска (в --stream - по одной, по мере готовности) """
+        start = self._next_position("final", run_id)
+        self._write(
+            "INSERT OR REPLACE INTO final (run_id, alert_id, position, record) VALUES (?, ?, ?, ?)",
+            [
+                (run_id, record["id"], pos, json.dumps(record, ensure_ascii=False))
+                for pos, record in enumerate(records, start)
+            ],
+        )
+
+    def set_final(self, run_id: str, records: List[dict]) -> None:
+        """ итог запуска целиком (старые записи этого запуска удаляются) """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM final WHERE run_id = ?", (run_id,))
+            self._conn.executemany(
+                "INSERT INTO final (run_id, alert_id, position, record) VALUES (?, ?, ?, ?)",
+                [(run_id, record["id"], pos, json.dumps(record, ensure_ascii=False)) for pos, record in enumerate(records)],
+            )
+
+    def _next_position(self, table: str, run_id: str, where: str = "", params: tuple = ()) -> int:
+        row = self._read(f"SELECT COALESCE(MAX(position) + 1, 0) FROM {table} WHERE run_id = ? {where}", (run_id, *params))
+        return row[0][0]
+
+    # --- чтение ---
+
+    def latest_run_id(self, with_final: bool = True) -> Optional[str]:
+        """ последний запуск (по умолчанию - из тех, где уже есть итоговые записи) """
+        if with_final:
+            rows = self._read(
+                "SELECT run_id FROM runs WHERE EXISTS (SELECT 1 FROM final WHERE final.run_id = runs.run_id) "
+                "ORDER BY started DESC LIMIT 1"
+            )
+        else:
+            rows = self._read("SELECT run_id FROM runs ORDER BY started DESC LIMIT 1")
+        return rows[0]["run_id"] if rows else None
+
+    def revision(self) -> int:
+        """ меняется, когда в базу пишет другое соединение (дешевая проверка "что-то изменилось") """
+        return self._read("PRAGMA data_version")[0][0]
+
+    def final_revision(self, run_id: str) -> Tuple[int, int]:
+        """ (число записей, max rowid) итога запуска - меняется при любой дозаписи/перезаписи, записи не читаются """
+        row = self._read("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM final WHERE run_id = ?", (run_id,))[0]
+        return row[0], row[1]
+
+    def runs(self, limit: int = 20) -> List[dict]:
+        rows = self._read(
+            "SELECT runs.*, (SELECT COUNT(*) FROM final WHERE final.run_id = runs.run_id) AS results "
+            "FROM runs ORDER BY started DESC LIMIT ?",
+            (limit,),
+        )
+        return [dict(row) for row in rows]
+
+    def alert(self, alert_id: str, run_id: Optional[str] = None) -> Optional[dict]:
+        """ алерт из указанного запуска, иначе - из самого свежего, где он встречался """
+        if run_id:
+            rows = self._read("SELECT data FROM alerts WHERE run_id = ? AND alert_id = ?", (run_id, alert_id))
+        else:
+            rows = self._read(
+                "SELECT data FROM alerts JOIN runs USING (run_id) WHERE alert_id = ? ORDER BY started DESC LIMIT 1",
+                (alert_id,),
+            )
+        return json.loads(rows[0]["data"]) if rows else None
+
+    def first_filter(self, run_id: str) -> Dict[str, List[str]]:
+        rows = self._read(
+            "SELECT alert_id, verdict FROM verdicts WHERE run_id = ? AND stage = ? ORDER BY position",
+            (run_id, FIRST),
+        )
+        return {
+            "relevant_ids": [row["alert_id"] for row in rows if row["verdict"] == "relevant"],
+            "unsure_ids": [row["alert_id"] for row in rows if row["verdict"] == "unsure"],
+        }
+
+    def contents(self, run_id: str) -> Dict[str, str]:
+        rows = self._read("SELECT alert_id, content FROM contents WHERE run_id = ? ORDER BY position", (run_id,))
+        return {row["alert_id"]: row["content"] for row in rows}
+
+    def summaries(self, run_id: str) -> Dict[str, dict]:
+        rows = self._read(
+            "SELECT alert_id, title, summary FROM summaries WHERE run_id = ? ORDER BY position", (run_id,)
+        )
+        return {row["alert_id"]: {"title": row["title"], "summary": row["summary"]} for row in rows}
+
+    def final(self, run_id: Optional[str] = None) -> List[dict]:
+        """ итог запуска (по умолчанию - последнего с результатами) """
+        run_id = run_id or self.latest_run_id()
+        if run_id is None:
+            return []
+        rows = self._read("SELECT record FROM final WHERE run_id = ? ORDER BY position", (run_id,))
+        return [json.loads(row["record"]) for row in rows]
+
+    def history(self, alert_id: str) -> List[dict]:
+        """ что происходило с алертом во всех запусках: вердикты стадий и выжимка """
+        rows = self._read(
+            "SELECT runs.run_id, runs.started, "
+            "  (SELECT verdict FROM verdicts v WHERE v.run_id = runs.run_id AND v.alert_id = a.alert_id AND stage = ?) AS first, "
+            "  (SELECT verdict FROM verdicts v WHERE v.run_id = runs.run_id AND v.alert_id = a.alert_id AND stage = ?) AS second, "
+            "  s.title, s.summary "
+            "FROM alerts a JOIN runs USING (run_id) "
+            "LEFT JOIN summaries s ON s.run_id = a.run_id AND s.alert_id = a.alert_id "
+            "WHERE a.alert_id = ? ORDER BY runs.started",
+            (FIRST, SECOND, alert_id),
+        )
+        return [dict(row) for row in rows]
+
+    # --- экспорт ---
+
+    def export_json(self, run_id: str) -> List[Path]:
+        """ выгружает запуск в json-папки в прежнем формате (<started>.json) """
+        with tracer.span("results.export_json", run_id):
+            return self._export_json(run_id)
+
+    def _export_json(self, run_id: str) -> List[Path]:
+        rows = self._read("SELECT started FROM runs WHERE run_id = ?", (run_id,))
+        if not rows:
+            raise KeyError(f"Run {run_id} not found")
+        name = f"{rows[0]['started']}.json"
+        exports = [
+            (RESPONSES_1_FOLDER, json.dumps(self.first_filter(run_id), indent=4)),
+            (CONTENTS_FOLDER, json.dumps(self.contents(run_id), indent=4)),
+            (RESPONSES_2_FOLDER, json.dumps(self.summaries(run_id), indent=4, ensure_ascii=False)),
+            (FINAL_FOLDER, json.dumps(self.final(run_id), indent=4, ensure_ascii=False)),
+        ]
+        paths = []
+        for folder, data in exports:
+            folder.mkdir(exist_ok=True)
+            path = folder / name
+            path.write_text(data)
+            paths.append(path)
+        return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="выгрузка запуска из results.db в json-папки")
+    parser.add_argument("run_id", nargs="?", help="по умолчанию - последний запуск с результатами")
+    args = parser.parse_args()
+    store = ResultStore()
+    run_id = args.run_id or store.latest_run_id()
+    if run_id is None:
+        parser.error("no runs with results in the database")
+    for path in store.export_json(run_id):
+        print(path)
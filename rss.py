@@ -0,0 +1,165 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import feedparser
+
+from constants import (
+    FEED_STATE_PATH,
+    RSS_MAX_WORKERS,
+    RSS_PER_HOST_CONCURRENCY,
+    RSS_PER_HOST_DELAY,
+)
+from ratelimit import HostLimiter
+from tracing import tracer
+from workqueue import FEED
+
+
+class FeedError(Exception):
+    """ фид не получен (сеть, HTTP-ошибка, не фид): его файл и валидаторы не трогаем """
+
+
+@dataclass
+class FeedResult:
+    name: str
+    link: str
+    status: int
+    alerts: Optional[List[dict]] = None  # None -> фид не изменился (304)
+    etag: Optional[str] = None
+    modified: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.alerts is None
+
+
+def article_link(link: str) -> str:
+    """ Google Alerts отдает ссылки вида https://www.google.com/url?rct=j&sa=t&url=<статья>&...
+    Достаем саму статью: иначе все страницы - один хост для HostLimiter и лишний редирект при загрузке """
+    parsed = urlparse(link)
+    if parsed.netloc.lower().endswith("google.com") and parsed.path == "/url":
+        query = parse_qs(parsed.query)
+        target = query.get("url") or query.get("q")
+        if target and target[0].startswith(("http://", "https://")):
+            return target[0]
+    return link
+
+
+def entry_to_alert(entry) -> dict:
+    return {
+        "id": hashlib.sha256(f"{entry.title}{entry.published}".encode()).hexdigest()[:8],
+        "title": entry.title,
+        "link": article_link(entry.link),
+        "content": entry.content,
+        "published": entry.published
+    }
+
+
+class FeedState:
+    """ ETag/Last-Modified для каждого фида, чтобы делать conditional GET """
+
+    def __init__(self, path: Path = FEED_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            self._state = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._state = {}
+
+    def get(self, name: str, link: str) -> dict:
+        with self._lock:
+            state = self._state.get(name, {})
+        # если ссылка на фид поменялась, старые валидаторы не годятся
+        if state.get("link") != link:
+            return {}
+        return state
+
+    def set(self, name: str, link: str, etag: Optional[str], modified: Optional[str]) -> None:
+        with self._lock:
+            self._state[name] = {"link": link, "etag": etag, "modified": modified}
+
+    def save(self) -> None:
+        with self._lock:
+            self.path.write_text(json.dumps(self._state, indent=4))
+
+
+def request_feed(name: str, link: str, etag: Optional[str] = None, modified: Optional[str] = None) -> FeedResult:
+    """ один conditional GET, без общего состояния (годится и для воркеров очереди, см. distributed.py) """
+    with tracer.span("feedparser.parse", name):
+        feed = feedparser.parse(link, etag=etag, modified=modified)
+    # feedparser не бросает исключений: при сбое сети нет status, при 5xx - пустые entries
+    status = feed.get("status")
+    if status is None or status >= 400:
+        raise FeedError(f"HTTP {status}: {feed.get('bozo_exception', 'no response')}")
+    if feed.get("bozo_exception") is not None and not feed.entries:
+        raise FeedError(f"not a feed: {feed.bozo_exception}")
+    if status == 304:
+        return FeedResult(name=name, link=link, status=status)
+    return FeedResult(
+        name=name,
+        link=link,
+        status=status,
+        alerts=[entry_to_alert(entry) for entry in feed.entries],
+        etag=feed.get("etag"),
+        modified=feed.get("modified"),
+    )
+
+
+def fetch_feed(name: str, link: str, state: FeedState, cached_copy_exists: bool) -> FeedResult:
+    # без локальной копии 304 нам ничего не даст, поэтому валидаторы не шлем
+    validators = state.get(name, link) if cached_copy_exists else {}
+    result = request_feed(name, link, validators.get("etag"), validators.get("modified"))
+    if not result.not_modified:
+        state.set(name, link, result.etag, result.modified)
+    return result
+
+
+def fetch_feeds(rss_links: Dict[str, str], alerts_folder: Path) -> Iterator[FeedResult]:
+    """ Тянет все фиды пулом потоков. Разные хосты идут параллельно,
+    на один хост - не больше RSS_PER_HOST_CONCURRENCY запросов с паузой RSS_PER_HOST_DELAY.
+    Результаты отдаются по мере готовности. """
+    state = FeedState()
+    limiter = HostLimiter(RSS_PER_HOST_CONCURRENCY, RSS_PER_HOST_DELAY)
+
+    def worker(name: str, link: str) -> FeedResult:
+        cached_copy_exists = (alerts_folder / name).with_suffix(".json").exists()
+        with limiter(link):
+            return fetch_feed(name, link, state, cached_copy_exists)
+
+    try:
+        with ThreadPoolExecutor(max_workers=RSS_MAX_WORKERS) as pool:
+            futures = {pool.submit(worker, name, link): name for name, link in rss_links.items()}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    print(f"Error fetching feed '{futures[future]}': {e}")
+    finally:
+        state.save()
+
+
+def fetch_feeds_queued(coordinator, rss_links: Dict[str, str], alerts_folder: Path) -> Iterator[FeedResult]:
+    """ то же, что fetch_feeds, но фиды качают воркеры очереди (distributed.Coordinator).
+    Валидаторы и их обновление остаются у координатора - воркерам общее состояние не нужно. """
+    state = FeedState()
+    payloads = {}
+    for name, link in rss_links.items():
+        validators = state.get(name, link) if (alerts_folder / name).with_suffix(".json").exists() else {}
+        payloads[name] = {"link": link, "etag": validators.get("etag"), "modified": validators.get("modified")}
+
+    try:
+        for name, result in coordinator.map(FEED, payloads):
+            if isinstance(result, Exception):
+                print(f"Error fetching feed '{name}': {result}")
+                continue
+            feed = FeedResult(**result)
+            if not feed.not_modified:
+                state.set(name, feed.link, feed.etag, feed.modified)
+            yield feed
+    finally:
+        state.save()
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import tiktoken
+
+from constants import (
+    LLM_PRICE_CACHED_INPUT_PER_MILLION,
+    LLM_PRICE_INPUT_PER_MILLION,
+    TOKEN_CACHE_MAX_ENTRIES,
+    TOKEN_CACHE_PATH,
+    TOKEN_ENCODE_THREADS,
+)
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    return tiktoken.encoding_for_model("gpt-4o")
+
+
+def truncate_tokens(text: str, limit: int) -> Tuple[str, bool]:
+    """ (первые limit токенов текста, набрался ли лимит) """
+    # текст короче limit символов отдаем как есть, не кодируя
+    if len(text) < limit:
+        return text, False
+    tokens = get_encoding().encode(text)
+    if len(tokens) < limit:
+        return text, False
+    return get_encoding().decode(tokens[:limit]), True
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def percentile(sorted_counts: List[int], q: float) -> int:
+    if not sorted_counts:
+        return 0
+    return sorted_counts[min(int(q * len(sorted_counts)), len(sorted_counts) - 1)]
+
+
+class TokenAccountant:
+    """ Токены по каждому элементу (алерт, текст страницы), а не по json всего payload.
+
+    Каждый текст кодируется один раз: число токенов кэшируется по хэшу текста и переживает
+    запуски (TOKEN_CACHE_PATH), промахи кодируются пачкой через encode_batch в несколько потоков.
+    По стадиям копятся точные суммы, распределение и оценка стоимости входа
+    (токенизатор gpt-4o - приближение токенов Gemini). """
+
+    def __init__(self, path: Path = TOKEN_CACHE_PATH, max_entries: int = TOKEN_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        try:
+            self._counts: Dict[str, int] = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._counts = {}
+        self._stages: Dict[str, dict] = {}
+
+    def count(self, texts: List[str]) -> List[int]:
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            missing = {key: text for key, text in zip(keys, texts) if key not in self._counts}
+        if missing:
+            encoded = get_encoding().encode_batch(list(missing.values()), num_threads=TOKEN_ENCODE_THREADS)
+            with self._lock:
+                self._counts.update(zip(missing, map(len, encoded)))
+        with self._lock:
+            return [self._counts[key] for key in keys]
+
+    def count_items(self, payload: List[dict]) -> List[int]:
+        """ элементы payload так, как они уходят в LLM - json """
+        return self.count([json.dumps(item) for item in payload])
+
+    def record(self, stage: str, counts: List[int], requests: int, system_prompt: str = "",
+               cached_prompt: bool = False) -> dict:
+        """ итог стадии: counts - токены элементов, requests - сколько запросов к LLM (каждый несет system prompt);
+        cached_prompt - промпт берется из кэша контекста и стоит как кэшированный вход """
+        prompt_tokens = self.count([system_prompt])[0] * requests if system_prompt else 0
+        prompt_price = LLM_PRICE_CACHED_INPUT_PER_MILLION if cached_prompt else LLM_PRICE_INPUT_PER_MILLION
+        ordered = sorted(counts)
+        total = sum(ordered)
+        summary = {
+            "items": len(ordered),
+            "total": total,
+            "mean": round(total / max(len(ordered), 1), 1),
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "max": ordered[-1] if ordered else 0,
+            "requests": requests,
+            "prompt_tokens": prompt_tokens,
+            "prompt_cached": cached_prompt,
+            "cost_usd": round((total * LLM_PRICE_INPUT_PER_MILLION + prompt_tokens * prompt_price) / 1_000_000, 4),
+        }
+        with self._lock:
+            self._stages[stage] = summary
+        return summary
+
+    def stats(self) -> dict:
+        """ поля ProcessStats: среднее - по всем посчитанным элементам, а не среднее средних стадий """
+        with self._lock:
+            stages = dict(self._stages)
+        total = sum(stage["total"] for stage in stages.values())
+        items = sum(stage["items"] for stage in stages.values())
+        return {
+            "tokens_processed": total,
+            "avg_tokens_per_item": round(total / max(items, 1), 1),
+            "token_stages": stages,
+        }
+
+    def reset(self) -> None:
+        """ новый запуск в том же процессе (daemon.py); кэш счетчиков остается """
+        with self._lock:
+            self._stages = {}
+
+    def save(self) -> None:
+        with self._lock:
+            # dict хранит порядок вставки: при переполнении выкидываем самые старые записи
+            overflow = len(self._counts) - self.max_entries
+            for key in list(self._counts)[:max(overflow, 0)]:
+                del self._counts[key]
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self._counts))
+            tmp_path.replace(self.path)
+
+
+# один на процесс, как кэш LLM
+accountant = TokenAccountant()
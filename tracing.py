@@ -0,0 +1,151 @@
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from constants import TRACE_MAX_EVENTS, TRACE_SLOWEST
+
+
+class Histogram:
+    """ Логарифмические корзины (шаг x1.25 от 0.1 мс): память не растет с числом замеров,
+    перцентили - с точностью до корзины (~12%). """
+
+    MIN = 1e-4
+    GROWTH = 1.25
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        index = 0 if seconds <= self.MIN else int(math.log(seconds / self.MIN, self.GROWTH)) + 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """ верхняя граница корзины, в которую попал q-й перцентиль """
+        target = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(self.MIN * self.GROWTH ** index, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total": round(self.total, 4),
+            "mean": round(self.total / max(self.count, 1), 4),
+            "p50": round(self.percentile(0.50), 4),
+            "p95": round(self.percentile(0.95), 4),
+            "p99": round(self.percentile(0.99), 4),
+            "max": round(self.max, 4),
+        }
+
+
+class Tracer:
+    """ Спаны вокруг горячих вызовов (сеть, LLM, чистка html, json I/O).
+
+    По каждой операции копится гистограмма длительностей и top-N самых медленных элементов -
+    это уходит в чекпоинт. Если record_events включен, спаны еще и пишутся событиями
+    для chrome://tracing / Perfetto (export_chrome_trace). """
+
+    def __init__(self, record_events: bool = False, max_events: int = TRACE_MAX_EVENTS,
+                 slowest: int = TRACE_SLOWEST):
+        self.record_events = record_events
+        self.max_events = max_events
+        self.slowest_size = slowest
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = defaultdict(Histogram)
+        self._slowest: Dict[str, list] = defaultdict(list)
+        self._events: List[dict] = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, operation: str, item: Optional[str] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(operation, start, time.perf_counter() - start, item)
+
+    def add(self, operation: str, start: float, duration: float, item: Optional[str] = None,
+            category: str = "span") -> None:
+        """ start - по time.perf_counter() """
+        with self._lock:
+            self._histograms[operation].add(duration)
+            if item is not None:
+                slowest = self._slowest[operation]
+                entry = (duration, item)
+                if len(slowest) < self.slowest_size:
+                    heapq.heappush(slowest, entry)
+                elif entry > slowest[0]:
+                    heapq.heapreplace(slowest, entry)
+        self.event(operation, start, duration, item, category)
+
+    def event(self, name: str, start: float, duration: float, item: Optional[str] = None,
+              category: str = "span") -> None:
+        """ только событие для трейса, без гистограммы (например, стадии пайплайна) """
+        if not self.record_events:
+            return
+        with self._lock:
+            if len(self._events) < self.max_events:
+                self._events.append({
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": round((start - self._origin) * 1e6),
+                    "dur": round(duration * 1e6),
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": {"item": item} if item is not None else {},
+                })
+
+    def reset(self) -> None:
+        """ новый запуск в том же процессе (daemon.py) """
+        with self._lock:
+            self._histograms.clear()
+            self._slowest.clear()
+            self._events.clear()
+            self._origin = time.perf_counter()
+
+    def summary(self) -> Dict[str, dict]:
+        """ {операция: count/total/mean/p50/p95/p99/max} (секунды) """
+        with self._lock:
+            return {operation: histogram.summary() for operation, histogram in sorted(self._histograms.items())}
+
+    def slowest(self, limit: int = TRACE_SLOWEST) -> List[dict]:
+        """ самые медленные элементы по всем операциям """
+        with self._lock:
+            entries = [
+                (duration, operation, item)
+                for operation, slowest in self._slowest.items()
+                for duration, item in slowest
+            ]
+        return [
+            {"operation": operation, "item": item, "duration": round(duration, 4)}
+            for duration, operation, item in heapq.nlargest(limit, entries)
+        ]
+
+    def export_chrome_trace(self, path: Path) -> Path:
+        """ json в формате Trace Event (открывается в chrome://tracing и ui.perfetto.dev) """
+        with self._lock:
+            events = list(self._events)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+        return path
+
+
+# один трейсер на процесс, как и клиент LLM / кэш
+tracer = Tracer()
@@ -0,0 +1,242 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from constants import QUEUE_DB_PATH, QUEUE_HEARTBEAT_INTERVAL, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS
+
+# виды заданий
+FEED = "feed"  # key - имя фида, payload - link + валидаторы conditional GET
+FETCH = "fetch"  # key - id алерта, payload - link
+SUMMARIZE = "summarize"  # key - id алерта, payload - текст страницы
+
+# состояния задания
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_runs (
+    run_id TEXT PRIMARY KEY,
+    open INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,  -- json
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    result TEXT,  -- json
+    error TEXT,
+    finished INTEGER,  -- порядковый номер завершения внутри запуска: по нему координатор забирает новые результаты
+    PRIMARY KEY (run_id, kind, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (run_id, state, lease_until);
+CREATE INDEX IF NOT EXISTS jobs_by_finished ON jobs (run_id, kind, finished);
+
+CREATE TABLE IF NOT EXISTS workers (
+    run_id TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    heartbeat REAL NOT NULL,
+    stats TEXT NOT NULL,  -- json, счетчики воркера по этому запуску
+    PRIMARY KEY (run_id, worker)
+);
+"""
+
+NEXT_FINISHED = "(SELECT IFNULL(MAX(finished), 0) + 1 FROM jobs WHERE run_id = ?)"
+
+
+@dataclass
+class Job:
+    run_id: str
+    kind: str
+    key: str
+    payload: dict
+    attempts: int
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """ Очередь заданий запуска (фиды, страницы, суммаризация) в SQLite-файле, без брокера.
+
+    Воркер берет задание в аренду на lease_seconds и продлевает ее heartbeat'ом; если воркер
+    умер, аренда истекает и задание достается другому (не больше max_attempts раз).
+    Все переходы - одиночные UPDATE, их атомарность между процессами дают файловые блокировки
+    SQLite. Журнал обычный (не WAL): WAL требует общей памяти и не работает на сетевых томах,
+    а очередь там и лежит, когда воркеры запущены на разных машинах. Сроки аренды считаются
+    по локальным часам, так что часы машин должны быть синхронизированы (NTP). """
+
+    def __init__(self, path: Path = QUEUE_DB_PATH, lease_seconds: float = QUEUE_LEASE_SECONDS,
+                 max_attempts: int = QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    def _read(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- запуски ---
+
+    def open_run(self, run_id: str) -> None:
+        self._write(
+            "INSERT INTO queue_runs (run_id, open, created) VALUES (?, 1, ?) "
+            "ON CONFLICT (run_id) DO UPDATE SET open = 1",
+            (run_id, time.time()),
+        )
+
+    def close_run(self, run_id: str) -> None:
+        self._write("UPDATE queue_runs SET open = 0 WHERE run_id = ?", (run_id,))
+
+    def is_open(self, run_id: str) -> bool:
+        rows = self._read("SELECT open FROM queue_runs WHERE run_id = ?", (run_id,))
+        return bool(rows and rows[0]["open"])
+
+    def latest_open_run(self) -> Optional[str]:
+        rows = self._read("SELECT run_id FROM queue_runs WHERE open = 1 ORDER BY created DESC LIMIT 1")
+        return rows[0]["run_id"] if rows else None
+
+    # --- задания ---
+
+    def enqueue(self, run_id: str, kind: str, payloads: Dict[str, dict]) -> None:
+        """ повторная постановка (--resume) не трогает выполненные задания, проваленные - дает еще попытки """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO jobs (run_id, kind, key, payload, state) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, kind, key) DO UPDATE SET "
+                "payload = excluded.payload, state = excluded.state, attempts = 0, error = NULL, finished = NULL "
+                "WHERE jobs.state = ?",
+                [(run_id, kind, key, json.dumps(payload), PENDING, FAILED) for key, payload in payloads.items()],
+            )
+
+    def lease(self, run_id: str, worker: str, limit: int = 1, kinds: Iterable[str] = ()) -> List[Job]:
+        """ свободные задания и задания с истекшей арендой -> в аренду воркеру """
+        now = time.time()
+        kinds = tuple(kinds)
+        kind_filter = f"AND kind IN ({', '.join('?' * len(kinds))})" if kinds else ""
+        with self._lock, self._conn:
+            # истекшие аренды без оставшихся попыток - провалены
+            self._conn.execute(
+                f"UPDATE jobs SET state = ?, error = 'lease expired', worker = NULL, lease_until = NULL, "
+                f"finished = {NEXT_FINISHED} "
+                "WHERE run_id = ? AND state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, run_id, run_id, LEASED, now, self.max_attempts),
+            )
+            rows = self._conn.execute(
+                "UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE rowid IN ("
+                "    SELECT rowid FROM jobs WHERE run_id = ? "
+                f"   AND (state = ? OR (state = ? AND lease_until < ?)) {kind_filter} "
+                "    ORDER BY rowid LIMIT ?"
+                ") RETURNING kind, key, payload, attempts",
+                (LEASED, worker, now + self.lease_seconds, run_id, PENDING, LEASED, now, *kinds, limit),
+            ).fetchall()
+        return [Job(run_id, row["kind"], row["key"], json.loads(row["payload"]), row["attempts"]) for row in rows]
+
+    def complete(self, job: Job, worker: str, result) -> bool:
+        """ False - аренду за это время забрали (воркер завис дольше lease_seconds), результат не нужен """
+        cursor = self._write(
+            f"UPDATE jobs SET state = ?, result = ?, error = NULL, lease_until = NULL, finished = {NEXT_FINISHED} "
+            "WHERE run_id = ? AND kind = ? AND key = ? AND worker = ? AND state = ?",
+            (DONE, json.dumps(result), job.run_id, job.run_id, job.kind, job.key, worker, LEASED),
+        )
+        return cursor.rowcount > 0
+
+    def fail(self, job: Job, worker: str, error: str) -> None:
+        """ ошибка выполнения: задание снова свободно, пока не кончились попытки """
+        if job.attempts < self.max_attempts:
+            self._write(
+                "UPDATE jobs SET state = ?, error = ?, worker = NULL, lease_until = NULL "
+                "WHERE run_id = ? AND kind = ? AND key = ? AND worker = ? AND state = ?",
+                (PENDING, error, job.run_id, job.kind, job.key, worker, LEASED),
+            )
+        else:
+            self._write(
+                f"UPDATE jobs SET state = ?, error = ?, lease_until = NULL, finished = {NEXT_FINISHED} "
+                "WHERE run_id = ? AND kind = ? AND key = ? AND worker = ? AND state = ?",
+                (FAILED, error, job.run_id, job.run_id, job.kind, job.key, worker, LEASED),
+            )
+
+    def finished(self, run_id: str, kind: str, after: int = 0) -> List[Tuple[int, str, str, object, Optional[str]]]:
+        """ завершенные после номера after: [(номер, key, состояние, результат, ошибка)] """
+        rows = self._read(
+            "SELECT finished, key, state, result, error FROM jobs "
+            "WHERE run_id = ? AND kind = ? AND finished > ? ORDER BY finished",
+            (run_id, kind, after),
+        )
+        return [
+            (row["finished"], row["key"], row["state"],
+             json.loads(row["result"]) if row["result"] is not None else None, row["error"])
+            for row in rows
+        ]
+
+    def counts(self, run_id: str, kind: Optional[str] = None) -> Dict[str, int]:
+        if kind is None:
+            rows = self._read("SELECT state, COUNT(*) AS n FROM jobs WHERE run_id = ? GROUP BY state", (run_id,))
+        else:
+            rows = self._read(
+                "SELECT state, COUNT(*) AS n FROM jobs WHERE run_id = ? AND kind = ? GROUP BY state", (run_id, kind)
+            )
+        return {row["state"]: row["n"] for row in rows}
+
+    # --- воркеры ---
+
+    def heartbeat(self, run_id: str, worker: str, stats: dict) -> None:
+        """ продлевает все аренды воркера и публикует его счетчики """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE run_id = ? AND worker = ? AND state = ?",
+                (now + self.lease_seconds, run_id, worker, LEASED),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers (run_id, worker, heartbeat, stats) VALUES (?, ?, ?, ?)",
+                (run_id, worker, now, json.dumps(stats)),
+            )
+
+    def rollup(self, run_id: str) -> dict:
+        """ счетчики всех воркеров запуска: по каждому и суммарно """
+        now = time.time()
+        workers = {}
+        totals: Dict[str, float] = {}
+        for row in self._read("SELECT worker, heartbeat, stats FROM workers WHERE run_id = ?", (run_id,)):
+            stats = json.loads(row["stats"])
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+            workers[row["worker"]] = {
+                **stats,
+                "alive": now - row["heartbeat"] < 3 * QUEUE_HEARTBEAT_INTERVAL,
+            }
+        return {
+            "workers": workers,
+            "alive": sum(worker["alive"] for worker in workers.values()),
+            "totals": totals,
+            "jobs": self.counts(run_id),
+        }